@@ -0,0 +1,169 @@
+import numpy as np
+import sys
+import os
+import copy
+import json
+import time
+import itertools
+
+from Model_Registry import get_spec, default_device
+from Classifier_Compare import Detector_Harness
+from Detector_Pareto import time_decode
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__))))
+from lib.Params import Params
+sys.path.pop()
+
+## Auto_Tuner: search the block, batch and thread settings of one detector
+class Auto_Tuner(object):
+    '''
+    The settings Params holds are the reference. Block lengths change the
+    decisions, so a candidate is kept only if its BER at tune_snr stays within
+    tune_ber_tolerance of the reference BER; decode batch size, threads and
+    DataLoader settings leave the decisions unchanged and are chosen on
+    throughput alone. Every candidate decodes the same records: the info bits
+    drawn past the compared ones cover the longest overlap_length of all
+    candidates, so the record and every noise draw after it stay the same.
+    '''
+    def __init__(self, params:Params, device):
+        self.params = params
+        self.device = device
+        self.detector = params.tune_detector
+        self.is_nn = self.detector != "prml" and get_spec(self.detector).is_nn
+        self.max_overlap = max([params.overlap_length] + [overlap for _, overlap in params.tune_block_lengths])
+        self.x = np.random.randn(params.tune_batch, params.tune_length)
+
+    def harness(self, settings):
+        params = copy.copy(self.params)
+        for name, value in settings.items():
+            setattr(params, name, value)
+        params.snr_start, params.snr_stop, params.snr_step = params.tune_snr, params.tune_snr, 1
+        params.eval_info_len = params.tune_info_len
+        harness = Detector_Harness(params)
+        harness.dummy_len = int(self.max_overlap * harness.rate_constrain)
+        if self.detector == "prml":
+            harness.register_prml()
+        else:
+            harness.register_model(self.detector, self.device)
+        return harness
+
+    def measure(self, settings, with_ber=True):
+        '''
+        output: throughput in bits/s of tune_batch rows of tune_length samples,
+        ber at tune_snr or None, for the Params settings replaced by settings
+        '''
+        harness = self.harness(settings)
+        ber = None
+        if with_ber:
+            np.random.seed(self.params.dataset_seed)
+            results = harness.run()
+            ber, self.num_bits = results[f"{self.detector}_ber"][0], results['num_bits'][0]
+        seconds = time_decode(harness, self.detector, self.x, self.params.tune_repeats)
+        return self.x.size / seconds, ber
+
+    def tune_blocks(self, reference_ber):
+        params = self.params
+        # one bit of slack, so that a zero reference ber does not reject every candidate
+        max_ber = reference_ber*(1 + params.tune_ber_tolerance) + 1/self.num_bits
+        best, best_throughput = None, 0
+        for eval_length, overlap_length in params.tune_block_lengths:
+            settings = {'eval_length': eval_length, 'overlap_length': overlap_length}
+            try:
+                throughput, ber = self.measure(settings)
+            except RuntimeError as error:
+                # a trained model whose layers depend on the block length
+                print(f"=> skip {settings}: {error}")
+                continue
+            accepted = ber <= max_ber
+            print(f"{settings}: {throughput:.4g} bits/s, ber {ber}{'' if accepted else ', rejected'}")
+            if accepted and throughput > best_throughput:
+                best, best_throughput = settings, throughput
+        return best or {'eval_length': params.eval_length, 'overlap_length': params.overlap_length}
+
+    def tune_decode(self, settings):
+        params = self.params
+        best, best_throughput = {}, 0
+        for decode_batch_size, torch_threads in itertools.product(params.tune_decode_batch_sizes, params.tune_torch_threads):
+            candidate = {'decode_batch_size': decode_batch_size, 'torch_threads': torch_threads}
+            throughput, _ = self.measure({**settings, **candidate}, with_ber=False)
+            print(f"{candidate}: {throughput:.4g} bits/s")
+            if throughput > best_throughput:
+                best, best_throughput = candidate, throughput
+        return best
+
+    def tune_loader(self):
+        '''
+        DataLoader workers and test batch size on the stored test set, the train
+        batch size changes the training itself and is left alone
+        '''
+        from torch.utils.data import DataLoader
+        from lib.Classifier_Dataset import ShardDataset, NoiseCollate
+
+        params = self.params
+        data_dir = '../data/classifier_test_set'
+        if not os.path.isdir(data_dir):
+            print(f"=> skip the DataLoader settings, no dataset found at '{data_dir}'")
+            return {}
+        dataset = ShardDataset(data_dir=data_dir, window=not params.raw_input)
+        collate_fn = NoiseCollate(dataset.layout, dataset.window) if dataset.layout.get('clean') else None
+
+        best, best_throughput = {}, 0
+        for loader_workers, batch_size in itertools.product(params.tune_loader_workers, params.tune_loader_batch_sizes):
+            loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=loader_workers,
+                                collate_fn=collate_fn)
+            start = time.perf_counter()
+            num_samples = sum(len(datas) for datas, _ in itertools.islice(loader, params.tune_loader_batches))
+            throughput = num_samples / (time.perf_counter() - start)
+            candidate = {'loader_workers': loader_workers, 'batch_size_test': batch_size}
+            print(f"{candidate}: {throughput:.4g} samples/s")
+            if throughput > best_throughput:
+                best, best_throughput = candidate, throughput
+        return best
+
+    def tune(self):
+        '''
+        output: dict of the chosen settings, their throughput and ber, and the reference ones
+        '''
+        reference_throughput, reference_ber = self.measure({})
+        print(f"reference: {reference_throughput:.4g} bits/s, ber {reference_ber}")
+
+        settings = self.tune_blocks(reference_ber)
+        if self.is_nn:
+            settings.update(self.tune_decode(settings))
+            settings.update(self.tune_loader())
+
+        throughput, ber = self.measure(settings)
+        print(f"tuned {settings}: {throughput:.4g} bits/s, ber {ber}")
+        return {
+            'settings': settings,
+            'throughput_bits_per_s': throughput,
+            'ber': ber,
+            'reference_throughput_bits_per_s': reference_throughput,
+            'reference_ber': reference_ber,
+            'snr': self.params.tune_snr
+        }
+
+def tune_sys():
+    params = Params()
+
+    # device
+    device = default_device()
+
+    tuner = Auto_Tuner(params, device)
+    result = tuner.tune()
+
+    # one profile holds the settings of every tuned detector
+    profile_file = params.tuned_profile_file or "../data/tuned_profile.json"
+    profile = {}
+    if os.path.isfile(profile_file):
+        with open(profile_file) as file:
+            profile = json.load(file)
+    profile[params.tune_detector] = result
+    with open(profile_file, "w") as file:
+        json.dump(profile, file, indent=1)
+    print(f"tuned profile have save to {profile_file}, set Params.tuned_profile_file to use it")
+
+if __name__ == '__main__':
+    tune_sys()
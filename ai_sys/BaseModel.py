@@ -1,7 +1,9 @@
 import sys
 import os
+import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 sys.path.append(
     os.path.dirname(
@@ -11,6 +13,19 @@ from lib.Params import Params
 from lib.Utils import codeword_threshold
 sys.path.pop()
 
+## Causal_Linear: the Linear of the sliding windows as a causal convolution of the raw sequence
+class Causal_Linear(nn.Linear):
+    '''
+    Input: (batch, length) raw samples
+    Output: (batch, length, out_features)
+    Mapping: the output of every sample is the Linear of its in_features window,
+    zero padded in front as sliding_shape; the parameters are those of nn.Linear,
+    so checkpoints of either layer load into the other
+    '''
+    def forward(self, x):
+        x = F.pad(torch.unsqueeze(x, 1), (self.in_features - 1, 0))
+        return F.conv1d(x, torch.unsqueeze(self.weight, 1), self.bias).transpose(1, 2)
+
 class BaseModel(nn.Module):
     def __init__(self, params:Params, device):
         super(BaseModel, self).__init__()
@@ -22,14 +37,100 @@ class BaseModel(nn.Module):
     def forward(self, x):
         pass
     
-    def decode(self, eval_length, data_eval, device):
-        data_eval = data_eval.to(device)
-        dec = torch.zeros((1, 0)).float().to(device)
-        for idx in range(data_eval.shape[0]):
-            truncation_in = data_eval[idx:idx + 1, : , :]
-            with torch.no_grad():
-                dec_block = codeword_threshold(self.forward(truncation_in)[:, :eval_length])
-            # concatenate the decoding codeword
-            dec = torch.cat((dec, dec_block), 1)
+    def input_layer(self, d_model):
+        '''
+        first layer of the model, it takes (batch, block_length) raw samples with
+        params.raw_input and (batch, block_length, input_size) windows otherwise
+        '''
+        if self.params.raw_input:
+            return Causal_Linear(self.params.input_size, d_model)
+        return nn.Linear(self.params.input_size, d_model)
+    
+    def decode(self, eval_length, data_eval, device, batch_size=None, soft=False):
+        '''
+        Input: (num_block, block_length, input_size) tensor, (num_block, block_length) with params.raw_input
+        Output: (1, num_block*eval_length) numpy array
+        Mapping: forward in mini-batches of batch_size blocks, the first
+        eval_length decisions of every block are written in order;
+        soft=True keeps the probabilities instead of the decided bits
+        '''
+        batch_size = batch_size or self.params.decode_batch_size
+        num_block = data_eval.shape[0]
+        dec = torch.empty((num_block, eval_length), device=device)
+        with torch.inference_mode():
+            for idx in range(0, num_block, batch_size):
+                truncation_in = data_eval[idx:idx + batch_size].to(device)
+                dec[idx:idx + batch_size] = self.forward(truncation_in)[:, :eval_length]
+            if not soft:
+                dec = codeword_threshold(dec)
             
-        return dec.cpu().numpy()
\ No newline at end of file
+        return dec.reshape(1, -1).cpu().numpy()
+    
+    def decode_record(self, x, device, batch_size=None, soft=False):
+        '''
+        Input: (batch, length) numpy array of equalizer inputs
+        Output: (batch, length) numpy array
+        Mapping: the record is cut into blocks of eval_length + overlap_length
+        starting every eval_length samples, the sliding windows of all blocks
+        are strided views decoded by decode; the blocks at the end of the
+        record are zero padded
+        '''
+        batch, length = x.shape
+        dec = self.decode(self.params.eval_length, self.record_windows(x), device, batch_size, soft).reshape(batch, -1)
+        return dec[:, :length].astype(np.float64)
+    
+    def decode_blocks(self, x, block_idx, device, batch_size=None, soft=False):
+        '''
+        Input: (batch, length) numpy array of equalizer inputs, indices of blocks
+        counted row after row as in decode_record
+        Output: (len(block_idx), eval_length) numpy array
+        Mapping: decode_record of the selected blocks only, every block is decoded on its own
+        '''
+        windows = self.record_windows(x)[torch.as_tensor(block_idx, dtype=torch.long)]
+        return self.decode(self.params.eval_length, windows, device, batch_size, soft).reshape(len(block_idx), -1)
+    
+    def record_windows(self, x):
+        '''
+        Input: (batch, length) numpy array
+        Output: (batch*num_block, block_length, input_size) strided tensor view,
+        (batch*num_block, block_length) with params.raw_input
+        Mapping: blocks of eval_length + overlap_length starting every eval_length
+        samples, zero padded at the end of the record, and their sliding windows
+        '''
+        params = self.params
+        eval_length = params.eval_length
+        block_length = params.eval_length + params.overlap_length
+        batch, length = x.shape
+        num_block = -(-length // eval_length)
+        
+        # zero padded up to whole blocks, as sliding_shape pads every block in front
+        x_pad = torch.zeros((batch, (num_block - 1)*eval_length + block_length))
+        x_pad[:, :length] = torch.from_numpy(x)
+        blocks = x_pad.unfold(1, block_length, eval_length).reshape(-1, block_length)
+        return self.block_windows(blocks)
+    
+    def block_windows(self, blocks):
+        '''
+        Input: (num_block, block_length) float32 tensor
+        Output: (num_block, block_length, input_size) strided view of the sliding
+        windows of every block, the blocks themselves with params.raw_input
+        '''
+        if self.params.raw_input:
+            return blocks
+        return F.pad(blocks, (self.params.input_size - 1, 0)).unfold(1, self.params.input_size, 1)
+
+## Frozen_Model: the decoding of BaseModel around the TorchScript forward of ai_sys/Model_Export.py
+class Frozen_Model(BaseModel):
+    '''
+    the frozen forward may hold int8 layers that only run on the cpu,
+    so the model decodes on the cpu whatever device it is given
+    '''
+    def __init__(self, params:Params, module):
+        super(Frozen_Model, self).__init__(params, torch.device("cpu"))
+        self.module = module
+
+    def forward(self, x):
+        return self.module(x)
+
+    def decode(self, eval_length, data_eval, device, batch_size=None, soft=False):
+        return super(Frozen_Model, self).decode(eval_length, data_eval, self.device, batch_size, soft)
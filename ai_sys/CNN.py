@@ -15,7 +15,7 @@ class CNN(BaseModel):
     def __init__(self, params: Params, device):
         super(CNN, self).__init__(params, device)
         
-        self.dec_input = nn.Linear(params.input_size, params.cnn_d_model)
+        self.dec_input = self.input_layer(params.cnn_d_model)
         
         self.dec_cnn = nn.Sequential(
             nn.Conv1d(
@@ -34,10 +34,10 @@ class CNN(BaseModel):
         
         x_bt_size = x.shape[0]
         
-        x = x.reshape(-1, self.params.input_size)
-        
         x = self.dec_input(x)
         
+        x = x.reshape(-1, self.params.cnn_d_model)
+        
         x = torch.unsqueeze(x, 2)
         
         x = self.dec_cnn(x)
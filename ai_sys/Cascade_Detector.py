@@ -0,0 +1,220 @@
+import numpy as np
+import sys
+import os
+import copy
+import time
+
+from Model_Registry import get_spec, load_model, default_device
+from Classifier_Compare import Detector_Harness, save_results
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__))))
+from lib.Utils import sliding_shape
+from lib.Params import Params
+from classical.Viterbi import prml_detector
+sys.path.pop()
+
+def block_min(x, eval_length):
+    '''
+    Input: (batch, length) array
+    Output: (batch, num_block) minimum of every block of eval_length samples, the last one padded with inf
+    '''
+    batch, length = x.shape
+    num_block = -(-length // eval_length)
+    x_pad = np.full((batch, num_block*eval_length), np.inf)
+    x_pad[:, :length] = x
+    return x_pad.reshape(batch, num_block, eval_length).min(axis=2)
+
+## PRML_Stage: PR equalizer and Viterbi detector, confidence from the metric gaps
+class PRML_Stage(object):
+    '''
+    overlap_length replaces params.overlap_length, a short overlap makes a cheap first stage;
+    the confidence of a block is the smallest metric gap along its survivor path,
+    on the scale of the squared PR equalizer output, not that of |2p - 1|
+    '''
+    def __init__(self, params:Params, overlap_length=None):
+        self.params = copy.copy(params)
+        if overlap_length is not None:
+            self.params.overlap_length = overlap_length
+
+        self.viterbi_detector, self.pr_adaptive_equalizer = prml_detector(self.params)
+
+    def equalize(self, x):
+        self.pr_adaptive_equalizer.equalizer_input = x
+        return self.pr_adaptive_equalizer.equalized_signal()
+
+    def detect(self, x):
+        '''
+        Input: (batch, length) equalizer input
+        Output: (batch, length) decisions, (batch, num_block) confidence of every block
+        '''
+        eval_length = self.params.eval_length
+        dec, gap = self.viterbi_detector.vit_dec_record(self.equalize(x), return_gap=True)
+        # the last samples no block decides keep an inf gap, they have no confidence at all
+        decided = len(range(0, x.shape[1] - self.params.overlap_length, eval_length))*eval_length
+        gap[:, decided:] = 0
+        return dec, block_min(gap, eval_length)
+
+    def detect_blocks(self, x, rows, blocks):
+        '''
+        Input: (batch, length) equalizer input, row and index of every block to decode
+        Output: (num_block, eval_length) decisions
+        '''
+        return self.viterbi_detector.vit_dec_blocks(self.equalize(x), rows, blocks*self.params.eval_length)
+
+## Model_Stage: a registered model, confidence from the margin of its probabilities
+class Model_Stage(object):
+    '''
+    the confidence of a block is the smallest |2p - 1| of its probabilities p
+    '''
+    def __init__(self, params:Params, model_arch, device):
+        self.params = copy.copy(params)
+        self.params.model_arch = model_arch
+        self.spec = get_spec(model_arch)
+        self.device = device
+        self.model, _ = load_model(self.params, device)
+
+    def record_features(self, x):
+        '''
+        Input: (batch, length) equalizer input
+        Output: (batch*num_block, eval_length, input_size) windows of the kept samples of every block
+        '''
+        params = self.params
+        eval_length = params.eval_length
+        block_length = params.eval_length + params.overlap_length
+        batch, length = x.shape
+        num_block = -(-length // eval_length)
+        x_pad = np.zeros((batch, (num_block - 1)*eval_length + block_length))
+        x_pad[:, :length] = x
+        blocks = np.lib.stride_tricks.sliding_window_view(x_pad, block_length, axis=1)[:, ::eval_length]
+        return sliding_shape(blocks.reshape(-1, block_length), params.input_size)[:, :eval_length, :]
+
+    def decode_features(self, features):
+        features = features.reshape(-1, self.params.input_size)
+        return self.model.decode(features.shape[0], features, soft=True).reshape(-1, self.params.eval_length)
+
+    def detect(self, x):
+        '''
+        Input: (batch, length) equalizer input
+        Output: (batch, length) decisions, (batch, num_block) confidence of every block
+        '''
+        batch, length = x.shape
+        if self.spec.decode == 'record':
+            prob = self.model.decode_record(x, self.device, soft=True)
+        else:
+            prob = self.decode_features(self.record_features(x)).reshape(batch, -1)[:, :length]
+        return (prob > 0.5).astype(np.float64), block_min(np.abs(2*prob - 1), self.params.eval_length)
+
+    def detect_blocks(self, x, rows, blocks):
+        '''
+        Input: (batch, length) equalizer input, row and index of every block to decode
+        Output: (num_block, eval_length) decisions
+        '''
+        num_block = -(-x.shape[1] // self.params.eval_length)
+        block_idx = rows*num_block + blocks
+        if self.spec.decode == 'record':
+            return self.model.decode_blocks(x, block_idx, self.device)
+        return (self.decode_features(self.record_features(x)[block_idx]) > 0.5).astype(np.float64)
+
+def build_stage(params:Params, name, device):
+    '''
+    "prml", "prml_short" with params.cascade_short_overlap, or a model_arch
+    '''
+    if name == "prml":
+        return PRML_Stage(params)
+    if name == "prml_short":
+        return PRML_Stage(params, params.cascade_short_overlap)
+    return Model_Stage(params, name, device)
+
+## Cascade_Detector: the first stage decodes every block, the second one those the first is unsure of
+class Cascade_Detector(object):
+    '''
+    blocks of eval_length samples whose first stage confidence is below
+    threshold are escalated; the escalated and decoded blocks are counted
+    for every call
+    '''
+    def __init__(self, params:Params, first, second, threshold):
+        self.params = params
+        self.first = first
+        self.second = second
+        self.threshold = threshold
+        self.escalation = []
+
+    def detect(self, x):
+        '''
+        Input: (batch, length) equalizer input
+        Output: (batch, length) decisions
+        '''
+        eval_length = self.params.eval_length
+        batch, length = x.shape
+        dec, confidence = self.first.detect(x)
+        rows, blocks = np.nonzero(confidence < self.threshold)
+        self.escalation.append(len(rows) / confidence.size)
+        if len(rows) == 0:
+            return dec
+
+        num_block = confidence.shape[1]
+        dec_pad = np.zeros((batch, num_block*eval_length))
+        dec_pad[:, :length] = dec
+        dec_pad.reshape(batch, num_block, eval_length)[rows, blocks] = self.second.detect_blocks(x, rows, blocks)
+        return dec_pad[:, :length]
+
+def timed(detect, seconds):
+    '''
+    detect appending the seconds of every call to the list seconds
+    '''
+    def timed_detect(x):
+        start = time.perf_counter()
+        dec = detect(x)
+        seconds.append(time.perf_counter() - start)
+        return dec
+    return timed_detect
+
+def cascade_sys():
+    params = Params()
+
+    # device
+    device = default_device()
+
+    first = build_stage(params, params.cascade_first, device)
+    second = build_stage(params, params.cascade_second, device)
+
+    # the second stage on every block is the reference the cascades are paired with;
+    # the sine of params.addsineon is added only when no model takes part, as in Detector_Harness
+    harness = Detector_Harness(params)
+    disturbed = isinstance(first, PRML_Stage) and isinstance(second, PRML_Stage)
+    seconds = {}
+    def register(name, detect):
+        seconds[name] = []
+        harness.register(name, timed(detect, seconds[name]), 'signal', disturbed)
+
+    register(params.cascade_second, lambda x: second.detect(x)[0])
+    register(params.cascade_first, lambda x: first.detect(x)[0])
+    cascades = {}
+    # the metric gap of prml and the |2p - 1| of a model have thresholds of their own
+    thresholds = params.cascade_prml_thresholds if isinstance(first, PRML_Stage) else params.cascade_model_thresholds
+    for threshold in thresholds:
+        name = f"cascade_{threshold}"
+        cascades[name] = Cascade_Detector(params, first, second, threshold)
+        register(name, cascades[name].detect)
+
+    results = harness.run()
+    num_bits = np.array(results['num_bits'])
+    for name in seconds:
+        results[f"{name}_bits_per_s"] = list(num_bits / np.array(seconds[name]))
+    for name, cascade in cascades.items():
+        results[f"{name}_escalation"] = cascade.escalation
+
+    for name in seconds:
+        escalation = f", escalation {np.mean(cascades[name].escalation):.4f}" if name in cascades else ""
+        print(f"{name:>16}: mean ber {np.mean(results[f'{name}_ber']):.4g}, "
+              f"{sum(num_bits) / sum(seconds[name]):.4g} bits/s{escalation}")
+
+    save_results(results, params.cascade_result_file)
+    print(f"cascade data have save to {params.cascade_result_file}")
+
+if __name__ == '__main__':
+    np.set_printoptions(threshold=sys.maxsize)
+    np.random.seed(12345)
+    cascade_sys()
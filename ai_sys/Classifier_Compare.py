@@ -0,0 +1,204 @@
+import numpy as np
+import sys
+import os
+import copy
+
+from Model_Registry import get_spec, load_model, default_device
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__))))
+from lib.Const import RLL_state_machine
+from lib.Utils import sliding_shape
+from lib.Channel_Modulator import RLL_Modulator
+from lib.Channel_Converter import NRZI_Converter
+from lib.Disk_Read_Channel import Disk_Read_Channel
+from lib.Params import Params
+from classical.Viterbi import prml_detector
+sys.path.pop()
+
+## Detector_Harness: run every registered detector on the same noisy records
+class Detector_Harness(object):
+    '''
+    Each snr point is synthesized once and fed to all detectors, so BERs are
+    paired on identical samples; the equalizer output and the sliding-window
+    features are built once per snr point and shared by the detectors using them.
+    With params.addsineon the sine is added only for the detectors registered
+    as disturbed, prml as realistic_sys decodes it; the models are trained and
+    evaluated by ai_sys without the sine and see the same samples without it
+    '''
+    def __init__(self, params:Params):
+        self.params = params
+        
+        encoder_dict, encoder_definite = RLL_state_machine()
+        
+        self.rate_constrain = encoder_dict[1]['input'].shape[1] / encoder_dict[1]['output'].shape[1]
+        self.dummy_len = int(params.overlap_length * self.rate_constrain)
+        
+        self.RLL_modulator = RLL_Modulator(encoder_dict, encoder_definite)
+        self.NRZI_converter = NRZI_Converter()
+        self.disk_read_channel = Disk_Read_Channel(params)
+        self.pr_adaptive_equalizer = None
+        self.viterbi_detector = None # detector of the last register_prml
+        
+        self.detectors = {}
+        self.disturbed = {} # whether the sine of params.addsineon is added for the detector
+        self.models = {} # loaded model of every registered model_arch
+    
+    def register(self, name, detect, needs, disturbed=False):
+        '''
+        detect maps the input named by needs to the decoded word of the record:
+        'equalized' is the (1, length) PR equalizer output,
+        'signal' the (1, length) equalizer input,
+        'features' the (num_block, block_length, input_size) sliding windows
+        of the equalizer input blocks;
+        disturbed detectors get the equalizer input with the sine of params.addsineon
+        '''
+        if needs == 'equalized' and self.pr_adaptive_equalizer is None:
+            _, self.pr_adaptive_equalizer = prml_detector(self.params)
+        self.detectors[name] = (detect, needs)
+        self.disturbed[name] = disturbed
+    
+    def register_prml(self, name="prml"):
+        self.viterbi_detector, _ = prml_detector(self.params)
+        self.register(name, self.viterbi_detector.vit_dec_record, 'equalized', disturbed=True)
+    
+    def register_model(self, model_arch, device):
+        params = copy.copy(self.params)
+        params.model_arch = model_arch
+        model, _ = load_model(params, device)
+        spec = get_spec(model_arch)
+        self.models[model_arch] = model
+        eval_length = params.eval_length
+        
+        if spec.decode == 'record':
+            def detect(signal):
+                return model.decode_record(signal, device)
+            self.register(model_arch, detect, 'signal')
+        else:
+            # per-sample classifiers: predict the kept eval_length samples of every block at once
+            def detect(features):
+                features = features[:, :eval_length, :].reshape(-1, params.input_size)
+                return model.decode(features.shape[0], features)
+            self.register(model_arch, detect, 'features')
+    
+    def block_features(self, x):
+        '''
+        Input: (batch, length) equalizer input
+        Output: (batch*num_block, block_length, input_size) float32 numpy array
+        Mapping: the sliding windows ai_sys builds for every block, row after row
+        '''
+        params = self.params
+        block_length = params.eval_length + params.overlap_length
+        blocks = np.lib.stride_tricks.sliding_window_view(x, block_length, axis=1)[:, ::params.eval_length]
+        return sliding_shape(blocks.reshape(-1, block_length), params.input_size, contiguous=True)
+    
+    def detector_inputs(self, x, needs):
+        '''
+        Input: (batch, length) equalizer input, names of the inputs to build
+        Output: dict of the inputs register() describes, for every row of x
+        '''
+        inputs = {}
+        if 'equalized' in needs:
+            self.pr_adaptive_equalizer.equalizer_input = x
+            inputs['equalized'] = self.pr_adaptive_equalizer.equalized_signal()
+        if 'signal' in needs:
+            inputs['signal'] = x
+        if 'features' in needs:
+            inputs['features'] = self.block_features(x)
+        return inputs
+    
+    def run(self):
+        '''
+        output: dict of per-snr columns, the detector BERs and, against the
+        first registered detector, the bit errors only one of the two makes
+        '''
+        params = self.params
+        num_ber = int((params.snr_stop-params.snr_start)/params.snr_step+1)
+        codeword_len = int(params.eval_info_len/self.rate_constrain)
+        needs = {disturbed: set(self.detectors[name][1] for name in self.detectors if self.disturbed[name] == disturbed)
+                 for disturbed in set(self.disturbed.values())}
+        reference = next(iter(self.detectors))
+        
+        results = {'snr': [], 'num_bits': []}
+        for name in self.detectors:
+            results[f"{name}_ber"] = []
+            if name != reference:
+                results[f"{name}_only_errors"] = []
+                results[f"{reference}_only_errors_vs_{name}"] = []
+        
+        snr_list = params.snr_start + np.arange(0, num_ber)*params.snr_step
+        snr_group_size = params.eval_snr_group_size or num_ber
+        for group in range(0, num_ber, snr_group_size):
+            snrs = snr_list[group:group+snr_group_size]
+            
+            info = np.random.randint(2, size = (1, params.eval_info_len + self.dummy_len))
+            codeword = self.NRZI_converter.forward_coding(self.RLL_modulator.forward_coding(info))
+            
+            signal_upsample_ideal, signal_upsample_jittered, rf_signal_ideal, rf_signal = self.disk_read_channel.RF_signal_jitter(codeword)
+            if params.jitteron:
+                rf_signal_input = rf_signal
+            else:
+                rf_signal_input = rf_signal_ideal
+            equalizer_input = {False: self.disk_read_channel.awgn_sweep(rf_signal_input, snrs, params.eval_shared_noise)}
+            equalizer_input[True] = equalizer_input[False]
+            if params.addsineon and True in needs:
+                equalizer_input[True] = self.disk_read_channel.addsin(equalizer_input[False])
+            
+            for row, snr in enumerate(snrs):
+                inputs = {disturbed: self.detector_inputs(equalizer_input[disturbed][row].reshape(1, -1), needs[disturbed])
+                          for disturbed in needs}
+                
+                errors = {}
+                for name, (detect, needs_name) in self.detectors.items():
+                    decodeword = np.asarray(detect(inputs[self.disturbed[name]][needs_name])).reshape(-1)
+                    errors[name] = decodeword[0:codeword_len] != codeword[0, 0:codeword_len]
+                
+                print("The SNR is:")
+                print(snr)
+                results['snr'].append(snr)
+                results['num_bits'].append(codeword_len)
+                for name, error in errors.items():
+                    ber = np.count_nonzero(error) / codeword_len
+                    print(f"The bit error rate (BER) use {name} is:")
+                    print(ber)
+                    results[f"{name}_ber"].append(ber)
+                    if name != reference:
+                        results[f"{name}_only_errors"].append(np.count_nonzero(error & ~errors[reference]))
+                        results[f"{reference}_only_errors_vs_{name}"].append(np.count_nonzero(~error & errors[reference]))
+        
+        return results
+
+def save_results(results, result_file):
+    '''
+    write the per-snr columns of Detector_Harness.run() to result_file as csv
+    '''
+    with open(result_file, "w") as file:
+        file.write(",".join(results) + "\n")
+        for row in zip(*results.values()):
+            file.write(",".join(str(value) for value in row) + "\n")
+
+def compare_sys():
+    params = Params()
+    
+    # device
+    device = default_device()
+    
+    harness = Detector_Harness(params)
+    for name in params.compare_detectors:
+        if name == "prml":
+            harness.register_prml()
+        elif os.path.isfile(get_spec(name).model_path(params)):
+            harness.register_model(name, device)
+        else:
+            print(f"=> skip {name}, no model found at '{get_spec(name).model_path(params)}'")
+    
+    results = harness.run()
+    
+    save_results(results, params.compare_result_file)
+    print(f"paired ber data have save to {params.compare_result_file}")
+
+if __name__ == '__main__':
+    np.set_printoptions(threshold=sys.maxsize)
+    np.random.seed(12345)
+    compare_sys()
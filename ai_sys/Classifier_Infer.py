@@ -1,16 +1,9 @@
 import numpy as np
-import torch
 import sys
 import os
 np.set_printoptions(threshold=sys.maxsize)
 
-from LR import LR
-from XGBoost import XGBoost
-from MLP import MLP
-from CNN import CNN
-from Unet1D import UNet1D
-from RNN import RNN
-from Transformer import Transformer
+from Model_Registry import load_model, get_spec, default_device
 sys.path.append(
     os.path.dirname(
         os.path.dirname(
@@ -21,6 +14,9 @@ from lib.Channel_Modulator import RLL_Modulator
 from lib.Channel_Converter import NRZI_Converter
 from lib.Disk_Read_Channel import Disk_Read_Channel
 from lib.Params import Params
+from lib.Profiler import Stage_Profiler, profile_run
+from lib.Stream_Pipeline import (chain, concurrent_chain, info_source, Tee, RLL_Stage, NRZI_Stage, RF_Channel_Stage,
+                                 AWGN_Stage, Block_Detector_Stage, BER_Counter)
 sys.path.pop()
 
 np.random.seed(12345)
@@ -46,55 +42,13 @@ def ai_sys():
     RLL_modulator = RLL_Modulator(encoder_dict, encoder_definite)
     NRZI_converter = NRZI_Converter()
     disk_read_channel = Disk_Read_Channel(params)
+    profiler = Stage_Profiler(params)
 
-    # device
-    os.environ['CUDA_VISIBLE_DEVICES'] = "0"
-    if torch.cuda.is_available():
-        device = torch.device("cuda")
-    else:
-        device = torch.device("cpu")
-
-    # model
-    model_file = None
-    is_nn = 0
-    if params.model_arch == "lr":
-        model = LR(params)
-        model_file = "lr_model.joblib"
-    elif params.model_arch == "xgboost":
-        model = XGBoost(params)
-        model_file = "xgb_model.json"
-    elif params.model_arch == "mlp":
-        is_nn = 1
-        model = MLP(params, device).to(device)
-        model_file = "mlp.pth.tar"
-    elif params.model_arch == "cnn":
-        is_nn = 1
-        model = CNN(params, device).to(device)
-        model_file = "cnn.pth.tar"
-    elif params.model_arch == "unet":
-        is_nn = 1
-        model = UNet1D(params, device).to(device)
-        model_file = "unet.pth.tar"
-    elif params.model_arch == "rnn":
-        is_nn = 1
-        model = RNN(params, device).to(device)
-        model_file = "rnn.pth.tar"
-    elif params.model_arch == "transformer":
-        is_nn = 1
-        model = Transformer(params, device).to(device)
-        model_file = "transformer.pth.tar"
-
-    # load model from model_file
-    model_path = f"{params.model_dir}/{model_file}"
-    if is_nn:
-        if os.path.isfile(model_path):
-            print("=> loading checkpoint '{}'".format(model_path))
-            checkpoint = torch.load(model_path, weights_only=False)
-            model.load_state_dict(checkpoint['state_dict'])
-        else:
-            print("=> no checkpoint found at '{}'".format(model_path))
-    else:
-        model.load_model(model_path)
+    # model, only the nn models need torch and a device, unless they run on numpy
+    spec = get_spec(params.model_arch)
+    use_numpy = spec.numpy_usable(params)
+    device = default_device() if spec.is_nn and not use_numpy else None
+    model, is_nn = load_model(params, device)
     
     # define ber
     num_ber = int((params.snr_stop-params.snr_start)/params.snr_step+1)
@@ -103,44 +57,145 @@ def ai_sys():
     ber_info = np.zeros((1, num_ber))
     
     # eval AI sys
+    # every group of snrs shares one clean record, its snr variants are derived in one broadcast
+    snr_list = params.snr_start + np.arange(0, num_ber)*params.snr_step
+    snr_group_size = params.eval_snr_group_size or num_ber
     ber_list = []
-    for idx in np.arange(0, num_ber):
-        snr = params.snr_start+idx*params.snr_step
+    for group in range(0, num_ber, snr_group_size):
+        snrs = snr_list[group:group+snr_group_size]
         
         info = np.random.randint(2, size = (1, params.eval_info_len + dummy_len))
-        codeword = NRZI_converter.forward_coding(RLL_modulator.forward_coding(info))
+        with profiler.stage("rll"):
+            modulated = RLL_modulator.forward_coding(info)
+        with profiler.stage("nrzi"):
+            codeword = NRZI_converter.forward_coding(modulated)
         
-        signal_upsample_ideal, signal_upsample_jittered, rf_signal_ideal, rf_signal = disk_read_channel.RF_signal_jitter(codeword)
-        if params.only_awgn:
-            rf_signal_input = rf_signal_ideal
-        else:
+        with profiler.stage("rf_signal"):
+            signal_upsample_ideal, signal_upsample_jittered, rf_signal_ideal, rf_signal = disk_read_channel.RF_signal_jitter(codeword)
+        if params.jitteron:
             rf_signal_input = rf_signal
-        equalizer_input = disk_read_channel.awgn(rf_signal_input, snr)
+        else:
+            rf_signal_input = rf_signal_ideal
+        with profiler.stage("awgn"):
+            equalizer_input = disk_read_channel.awgn_sweep(rf_signal_input, snrs, params.eval_shared_noise)
         
-        length = equalizer_input.shape[1]
-        decodeword = np.empty((1, 0))
-        for pos in range(0, length - params.overlap_length, params.eval_length):
-            equalizer_input_truncation = equalizer_input[:, pos:pos+params.eval_length+params.overlap_length]
-            truncation_input = sliding_shape(equalizer_input_truncation, params.input_size)
-            if is_nn:
-                truncation_input = torch.from_numpy(truncation_input).float().to(device)
-                dec_tmp = model.decode(params.eval_length, truncation_input, device)
-            else:
-                dec_tmp = model.decode(params.eval_length, truncation_input[0, :, :])
-            decodeword = np.append(decodeword, dec_tmp, axis=1)
+        # decode all snr rows at once, the nn and numpy models cut their windows inside decode_record
+        if is_nn or use_numpy:
+            with profiler.stage("detector"):
+                decodeword = model.decode_record(equalizer_input, device)
+        else:
+            length = equalizer_input.shape[1]
+            decodeword = np.zeros(equalizer_input.shape)
+            for pos in range(0, length - params.overlap_length, params.eval_length):
+                equalizer_input_truncation = equalizer_input[:, pos:pos+params.eval_length+params.overlap_length]
+                with profiler.stage("windowing"):
+                    truncation_input = sliding_shape(equalizer_input_truncation, params.input_size)
+                with profiler.stage("detector"):
+                    decodeword[:, pos:pos+params.eval_length] = np.concatenate(
+                        [model.decode(params.eval_length, truncation_input[row, :, :]) for row in range(len(snrs))], axis=0)
+        profiler.point(model_arch=params.model_arch, snr=" ".join(str(snr) for snr in snrs))
 
+        for snr, decodeword_snr in zip(snrs, decodeword):
+            print("The SNR is:")
+            print(snr)
+            ber = (np.count_nonzero(np.abs(codeword[0, 0:codeword_len] - decodeword_snr[0:codeword_len])) / codeword_len)
+            print(f"The bit error rate (BER) use {params.model_arch} is:")
+            print(ber)
+            ber_list.append(ber)
+    
+    ber_file = f"../data/{params.model_arch}_result.txt"
+    with open(ber_file, "w") as file:
+        for ber in ber_list:
+            file.write(f"{ber}\n")
+    print(f"ber data have save to {ber_file}")
+    profiler.save()
+
+def block_decoder(model, record_model, device):
+    '''
+    decode_blocks of Block_Detector_Stage: (num_block, block_length) equalizer input
+    blocks to the (num_block, eval_length) decisions of model
+    '''
+    eval_length = params.eval_length
+    def decode_blocks(blocks):
+        if record_model:
+            import torch
+            windows = model.block_windows(torch.from_numpy(blocks).float())
+            return model.decode(eval_length, windows, device).reshape(-1, eval_length)
+        features = sliding_shape(blocks, params.input_size)[:, :eval_length, :].reshape(-1, params.input_size)
+        return model.decode(features.shape[0], features).reshape(-1, eval_length)
+    return decode_blocks
+
+def streaming_ai_sys():
+    '''
+    ai_sys on a stream of params.stream_chunk_bits info bits per chunk, the
+    model decodes every block of eval_length + overlap_length on its own;
+    with params.stream_workers the stages run concurrently
+    '''
+    global params
+    params = Params()
+    
+    encoder_dict, encoder_definite = RLL_state_machine()
+    num_sym_in_constrain = encoder_dict[1]['input'].shape[1]
+    num_sym_out_constrain = encoder_dict[1]['output'].shape[1]
+    rate_constrain = num_sym_in_constrain / num_sym_out_constrain
+    dummy_len = int(params.overlap_length * num_sym_in_constrain 
+                 / num_sym_out_constrain)
+    
+    RLL_modulator = RLL_Modulator(encoder_dict, encoder_definite)
+    disk_read_channel = Disk_Read_Channel(params)
+    profiler = Stage_Profiler(params)
+    
+    spec = get_spec(params.model_arch)
+    use_numpy = spec.numpy_usable(params)
+    record_model = spec.is_nn and not use_numpy
+    device = default_device() if record_model else None
+    model, _ = load_model(params, device)
+    decode_blocks = profiler.wrap("detector", block_decoder(model, record_model, device))
+    
+    num_ber = int((params.snr_stop-params.snr_start)/params.snr_step+1)
+    codeword_len = int(params.eval_info_len/rate_constrain)
+    snr_list = params.snr_start + np.arange(0, num_ber)*params.snr_step
+    ber_list = []
+    for snr in snr_list:
+        if params.stream_workers:
+            # concurrent stages draw from random states of their own, in a fixed order
+            source_rng, jitter_rng, noise_rng = [np.random.RandomState(seed) for seed in np.random.randint(2**31, size=3)]
+        else:
+            source_rng = jitter_rng = noise_rng = np.random
+        
+        codeword_tee = Tee()
+        detector_stage = Block_Detector_Stage(params, decode_blocks)
+        # torch models stay in the main process
+        detector_stage.process_safe = not record_model
+        stages = [
+            RLL_Stage(RLL_modulator),
+            NRZI_Stage(),
+            codeword_tee,
+            RF_Channel_Stage(params, disk_read_channel, params.jitteron, jitter_rng),
+            AWGN_Stage(params, snr, noise_rng),
+            detector_stage
+        ]
+        source = info_source(params.eval_info_len + dummy_len, params.stream_chunk_bits, rng=source_rng)
+        if params.stream_workers:
+            decisions = concurrent_chain(source, stages, params.stream_workers, params.stream_queue_size)
+        else:
+            decisions = chain(source, *stages)
+        ber = BER_Counter(codeword_tee, codeword_len).consume(decisions)
+        
         print("The SNR is:")
         print(snr)
-        ber = (np.count_nonzero(np.abs(codeword[:, 0:codeword_len] - decodeword[:, 0:codeword_len])) / codeword_len)
         print(f"The bit error rate (BER) use {params.model_arch} is:")
         print(ber)
         ber_list.append(ber)
+        profiler.point(model_arch=params.model_arch, snr=snr)
     
     ber_file = f"../data/{params.model_arch}_result.txt"
     with open(ber_file, "w") as file:
         for ber in ber_list:
             file.write(f"{ber}\n")
     print(f"ber data have save to {ber_file}")
+    profiler.save()
 
 if __name__ == '__main__':
-    ai_sys()
\ No newline at end of file
+    run_params = Params()
+    profile_run(run_params, streaming_ai_sys if run_params.stream_chunk_bits else ai_sys)
\ No newline at end of file
@@ -6,24 +6,22 @@ import torch.nn.functional as F
 import numpy as np
 import sys
 import datetime
+import itertools
+import copy
 np.set_printoptions(threshold=sys.maxsize)
 
 from BaseModel import BaseModel
-from LR import LR
-from XGBoost import XGBoost
-from MLP import MLP
-from CNN import CNN
-from Unet1D import UNet1D
-from RNN import RNN
-from Transformer import Transformer
+from Model_Registry import get_spec, build_model, load_model
 sys.path.append(
     os.path.dirname(
         os.path.dirname(
             os.path.abspath(__file__))))
 from lib.Params import Params
-from lib.Classifier_Dataset import PthDataset
+from lib.Classifier_Dataset import ShardDataset, SyntheticDataset, NoiseCollate
 sys.path.pop()
 
+np.random.seed(12345)
+
 def main():
     global params
     params = Params()
@@ -35,51 +33,42 @@ def main():
     else:
         device = torch.device("cpu")
         
-    # data loader
-    train_dataset = PthDataset(file_path='../data/classifier_train_set.pth')
-    test_dataset = PthDataset(file_path='../data/classifier_test_set.pth')
-    val_dataset = PthDataset(file_path='../data/classifier_validate_set.pth')
-
     # model
-    model_file = None
-    is_nn = 0
-    if params.model_arch == "lr":
-        model = LR(params)
-        model_file = "lr_model.joblib"
-    elif params.model_arch == "xgboost":
-        model = XGBoost(params)
-        model_file = "xgb_model.json"
-    elif params.model_arch == "mlp":
-        is_nn = 1
-        model = MLP(params, device).to(device)
-        model_file = "mlp.pth.tar"
-    elif params.model_arch == "cnn":
-        is_nn = 1
-        model = CNN(params, device).to(device)
-        model_file = "cnn.pth.tar"
-    elif params.model_arch == "unet":
-        is_nn = 1
-        model = UNet1D(params, device).to(device)
-        model_file = "unet.pth.tar"
-    elif params.model_arch == "rnn":
-        is_nn = 1
-        model = RNN(params, device).to(device)
-        model_file = "rnn.pth.tar"
-    elif params.model_arch == "transformer":
-        is_nn = 1
-        model = Transformer(params, device).to(device)
-        model_file = "transformer.pth.tar"
+    model, spec = build_model(params, device)
+    is_nn = spec.is_nn
+    
+    # data loader, the models built with raw_input take the blocks unwindowed
+    window = not (is_nn and params.raw_input)
+    if params.train_on_the_fly:
+        train_dataset = SyntheticDataset(params)
+    else:
+        train_dataset = ShardDataset(data_dir='../data/classifier_train_set', window=window)
+    test_dataset = ShardDataset(data_dir='../data/classifier_test_set', window=window)
+    val_dataset = ShardDataset(data_dir='../data/classifier_validate_set', window=window)
     
     # model dir
     if not os.path.exists(params.model_dir):
         os.makedirs(params.model_dir)
         
-    model_path = f"{params.model_dir}/{model_file}"
+    model_path = spec.model_path(params)
+    
+    # teacher of the distillation
+    teacher = None
+    if params.distill_teacher:
+        teacher = load_teacher(device)
+        if not is_nn:
+            raise ValueError(f"only nn students are distilled, model_arch is {params.model_arch}")
     
     if not is_nn:
-        X_train, y_train = train_dataset.data.numpy().reshape(-1, 6), train_dataset.label.numpy().reshape(-1)
-        X_test,  y_test  = test_dataset.data.numpy().reshape(-1, 6),  test_dataset.label.numpy().reshape(-1)
-        X_val,   y_val   = val_dataset.data.numpy().reshape(-1, 6),   val_dataset.label.numpy().reshape(-1)
+        if params.train_on_the_fly:
+            # lr and xgboost fit on whole arrays, so they always read the stored train set
+            train_dataset = ShardDataset(data_dir='../data/classifier_train_set')
+        X_train, y_train = train_dataset.arrays()
+        X_test,  y_test  = test_dataset.arrays()
+        X_val,   y_val   = val_dataset.arrays()
+        X_train, y_train = X_train.reshape(-1, 6), y_train.reshape(-1)
+        X_test,  y_test  = X_test.reshape(-1, 6),  y_test.reshape(-1)
+        X_val,   y_val   = X_val.reshape(-1, 6),   y_val.reshape(-1)
     
         model.fit(X_train, y_train, X_test, y_test)
         
@@ -92,9 +81,16 @@ def main():
         if params.model_arch == "xgboost":
             model.feature_importance()
     else:
-        train_loader = DataLoader(train_dataset, batch_size=params.batch_size_train, shuffle=True, num_workers=4)
-        test_loader = DataLoader(test_dataset, batch_size=params.batch_size_test, shuffle=False, num_workers=4)
-        val_loader = DataLoader(val_dataset, batch_size=params.batch_size_val, shuffle=False, num_workers=4)
+        if params.train_on_the_fly:
+            train_loader = DataLoader(train_dataset, batch_size=params.batch_size_train, num_workers=params.loader_workers)
+        else:
+            train_loader = DataLoader(train_dataset, batch_size=params.batch_size_train, shuffle=True, num_workers=params.loader_workers,
+                                      collate_fn=NoiseCollate(train_dataset.layout, window) if train_dataset.layout.get('clean') else None)
+        # the test blocks get the same noise in every epoch, so their loss compares across epochs
+        test_collate = NoiseCollate(test_dataset.layout, window, params.dataset_seed) if test_dataset.layout.get('clean') else None
+        test_loader = DataLoader(test_dataset, batch_size=params.batch_size_test, shuffle=False, num_workers=params.loader_workers,
+                                 collate_fn=test_collate)
+        val_loader = DataLoader(val_dataset, batch_size=params.batch_size_val, shuffle=False, num_workers=params.loader_workers)
         
         # criterion and optimizer
         optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, model.parameters()), 
@@ -118,7 +114,12 @@ def main():
         for epoch in range(params.num_epoch):
             
             # train and validate
-            train_loss = train(train_loader, model, optimizer, epoch, device)
+            if params.train_on_the_fly:
+                train_loss = train(itertools.islice(train_loader, params.synthetic_steps_per_epoch), model, optimizer, epoch, device, teacher)
+            else:
+                train_loss = train(train_loader, model, optimizer, epoch, device, teacher)
+            if test_collate:
+                test_collate.reset()
             test_loss, ber = validate(test_loader, val_loader, model, epoch, device)
             
             result.write('epoch %d \n' % epoch)
@@ -137,9 +138,62 @@ def main():
                 'state_dict': model.state_dict(),
                 'optimizer': optimizer.state_dict(),
             }, model_path, pickle_protocol=4)
+        
+        if teacher is not None:
+            report = distill_report(device)
+            result.write('distillation report:' + str(report) + '\n')
         result.close()
+
+def load_teacher(device):
+    '''
+    the trained params.distill_teacher in eval mode, always its float checkpoint
+    '''
+    if params.distill_teacher == params.model_arch:
+        raise ValueError(f"the teacher and the student are both {params.model_arch}")
+    teacher_spec = get_spec(params.distill_teacher)
+    if not teacher_spec.is_nn:
+        raise ValueError(f"only nn teachers give soft outputs, distill_teacher is {params.distill_teacher}")
+    if not os.path.isfile(teacher_spec.model_path(params)):
+        raise FileNotFoundError(f"no teacher checkpoint found at '{teacher_spec.model_path(params)}'")
+    teacher_params = copy.copy(params)
+    teacher_params.model_arch = params.distill_teacher
+    # the student learns the outputs of the float model, the exported ones are not callable modules on any device
+    teacher_params.use_numpy_model = teacher_params.use_frozen_model = False
+    teacher, _ = load_model(teacher_params, device)
+    return teacher
+
+def distill_report(device):
+    '''
+    output: dict of the teacher and student ber at every pareto_snrs, their throughput
+    in bits/s decoding the same records, the throughput gain and ber gap of the student
+    '''
+    # the harness is imported only when there is a teacher to report on
+    from Classifier_Compare import Detector_Harness
+    from Detector_Pareto import time_decode, reference_bers, register
+    
+    detectors = [params.distill_teacher, params.model_arch]
+    bers = reference_bers(params, detectors, device)
+    
+    harness = Detector_Harness(params)
+    register(harness, detectors, device)
+    x = np.random.randn(max(params.pareto_batches), params.pareto_length)
+    throughput = {name: x.size / time_decode(harness, name, x, params.pareto_repeats) for name in detectors}
     
-def train(train_loader, model:BaseModel, optimizer, epoch, device):
+    teacher, student = detectors
+    report = {
+        'snr': params.pareto_snrs,
+        'teacher_ber': bers[teacher],
+        'student_ber': bers[student],
+        'ber_gap': [s - t for s, t in zip(bers[student], bers[teacher])],
+        'teacher_bits_per_s': throughput[teacher],
+        'student_bits_per_s': throughput[student],
+        'throughput_gain': throughput[student] / throughput[teacher]
+    }
+    print(f"student {student} of teacher {teacher}: {report['throughput_gain']:.3g}x throughput, "
+          f"ber gap {report['ber_gap']} at snrs {params.pareto_snrs}")
+    return report
+    
+def train(train_loader, model:BaseModel, optimizer, epoch, device, teacher:BaseModel=None):
     # switch to train mode
     model.train()
     
@@ -150,7 +204,12 @@ def train(train_loader, model:BaseModel, optimizer, epoch, device):
         
         optimizer.zero_grad()
         output = model(datas)
-        loss = loss_func(output, labels, device)
+        if teacher is None:
+            loss = loss_func(output, labels, device)
+        else:
+            with torch.no_grad():
+                teacher_output = teacher(datas)
+            loss = distill_loss_func(output, teacher_output, labels, device)
 
         # compute gradient and do gradient step
         loss.backward()
@@ -204,6 +263,17 @@ def validate(test_loader, val_loader, model:BaseModel, epoch, device):
 
 def loss_func(output, label, device):
     return F.binary_cross_entropy(output, label).to(device)
+
+def distill_loss_func(output, teacher_output, label, device):
+    '''
+    the loss against the teacher probabilities, both softened by distill_temperature,
+    mixed by distill_alpha with the loss against the labels
+    '''
+    temperature = params.distill_temperature
+    soft_output = torch.sigmoid(torch.logit(output, eps=1e-6) / temperature)
+    soft_label = torch.sigmoid(torch.logit(teacher_output, eps=1e-6) / temperature)
+    soft_loss = F.binary_cross_entropy(soft_output, soft_label) * temperature**2
+    return (params.distill_alpha*soft_loss + (1 - params.distill_alpha)*loss_func(output, label, device)).to(device)
         
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,261 @@
+import numpy as np
+import sys
+import os
+import copy
+import json
+import time
+import queue
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from Model_Registry import get_spec, load_model, default_device
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__))))
+from lib.Params import Params
+from classical.Viterbi import prml_detector
+sys.path.pop()
+
+def build_detector(params:Params, device):
+    '''
+    detector of params.server_detector on (batch, length) sample rows
+    output: detect(x, input_kind) -> (bits, probabilities or None), supports_soft
+    input_kind is 'rf' for equalizer input samples or 'equalized' for equalizer output samples
+    '''
+    if params.server_detector == "prml":
+        viterbi_detector, pr_adaptive_equalizer = prml_detector(params)
+
+        def detect(x, input_kind):
+            if input_kind == 'rf':
+                pr_adaptive_equalizer.equalizer_input = x
+                x = pr_adaptive_equalizer.equalized_signal()
+            return viterbi_detector.vit_dec_record(x), None
+        return detect, False
+
+    params = copy.copy(params)
+    params.model_arch = params.server_detector
+    if get_spec(params.model_arch).decode != 'record':
+        raise ValueError(f"server_detector {params.server_detector} is neither prml nor a nn model")
+    model, _ = load_model(params, device)
+
+    def detect(x, input_kind):
+        if input_kind != 'rf':
+            raise ValueError(f"{params.model_arch} decodes the equalizer input, not {input_kind} samples")
+        prob = model.decode_record(x, device, soft=True)
+        return (prob > 0.5).astype(np.float64), prob
+    return detect, True
+
+## Decode_Batcher: decode the requests of all clients in shared batched calls
+class Decode_Batcher(object):
+    '''
+    Requests waiting at the same time are stacked as rows of one record batch
+    and decoded by one detect call. A batch closes after server_latency_ms or
+    once it holds server_batch_samples samples. Every row is zero padded past
+    the block of its last sample plus overlap_length, the zeros a request gets
+    when it is decoded alone, so that its last samples are decided and its bits
+    do not depend on the requests it shares a batch with
+    '''
+    def __init__(self, params:Params, detect):
+        self.params = params
+        self.detect = detect
+        self.requests = queue.Queue()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, samples, input_kind='rf'):
+        '''
+        Input: (length,) samples, 'rf' or 'equalized'
+        Output: (length,) decided bits, (length,) probabilities or None
+        Mapping: blocks until the batch holding the request is decoded
+        '''
+        request = {'samples': samples, 'input': input_kind, 'done': threading.Event()}
+        self.requests.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['bits'], request['prob']
+
+    def next_batch(self):
+        batch = [self.requests.get()]
+        num_samples = len(batch[0]['samples'])
+        deadline = time.monotonic() + self.params.server_latency_ms / 1000
+        while num_samples < self.params.server_batch_samples:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            num_samples += len(request['samples'])
+        return batch
+
+    def padded_length(self, length):
+        eval_length = self.params.eval_length
+        return -(-length // eval_length)*eval_length + self.params.overlap_length
+
+    def decode(self, samples, input_kind):
+        '''
+        Input: list of (length,) sample arrays of one input kind
+        Output: list of (length,) decided bits, list of (length,) probabilities or None
+        '''
+        x = np.zeros((len(samples), max(self.padded_length(len(row)) for row in samples)))
+        for row, request_samples in enumerate(samples):
+            x[row, :len(request_samples)] = request_samples
+        bits, prob = self.detect(x, input_kind)
+        return ([bits[row, :len(row_samples)] for row, row_samples in enumerate(samples)],
+                [None if prob is None else prob[row, :len(row_samples)] for row, row_samples in enumerate(samples)])
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            for input_kind in set(request['input'] for request in batch):
+                requests = [request for request in batch if request['input'] == input_kind]
+                try:
+                    bits, prob = self.decode([request['samples'] for request in requests], input_kind)
+                except Exception as error:
+                    for request in requests:
+                        request['error'] = error
+                        request['done'].set()
+                    continue
+
+                for row, request in enumerate(requests):
+                    request['bits'], request['prob'] = bits[row], prob[row]
+                    request['done'].set()
+
+def check_batching(batcher:Decode_Batcher, length=1000):
+    '''
+    the bits of a request decoded alone and in a batch with a longer and a shorter
+    request must be the same, raises RuntimeError otherwise
+    '''
+    samples = [np.random.randn(length), np.random.randn(length + 37), np.random.randn(length // 2 + 11)]
+    alone, _ = batcher.decode(samples[:1], 'rf')
+    batched, _ = batcher.decode(samples, 'rf')
+    if not np.array_equal(alone[0], batched[0]):
+        raise RuntimeError(f"{batcher.params.server_detector} decodes a request differently in a batch")
+
+## Decode_Handler: POST /decode with a chunk of samples, GET /health
+class Decode_Handler(BaseHTTPRequestHandler):
+    '''
+    application/json body: {"samples": [...], "input": "rf" | "equalized", "soft": false}
+    answer: {"bits": [...]} with "soft": [...] probabilities when asked for
+    application/octet-stream body: float32 samples, input and soft as query parameters
+    answer: uint8 bits followed by float32 probabilities when asked for
+    '''
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            return self.reply_error(404, "not found")
+        params = self.server.params
+        self.reply(200, "application/json", json.dumps({
+            'detector': params.server_detector,
+            'soft': self.server.supports_soft,
+            'eval_length': params.eval_length,
+            'overlap_length': params.overlap_length
+        }).encode())
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/decode":
+            return self.reply_error(404, "not found")
+
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        binary = self.headers.get('Content-Type', '').startswith("application/octet-stream")
+        try:
+            if binary:
+                query = parse_qs(url.query)
+                samples = np.frombuffer(body, dtype='<f4').astype(np.float64)
+                input_kind = query.get('input', ['rf'])[0]
+                soft = query.get('soft', ['0'])[0] in ('1', 'true')
+            else:
+                request = json.loads(body)
+                samples = np.asarray(request['samples'], dtype=np.float64).reshape(-1)
+                input_kind = request.get('input', 'rf')
+                soft = bool(request.get('soft', False))
+        except (ValueError, KeyError) as error:
+            return self.reply_error(400, f"bad request: {error}")
+
+        if input_kind not in ('rf', 'equalized'):
+            return self.reply_error(400, f"unknown input {input_kind}")
+        if soft and not self.server.supports_soft:
+            return self.reply_error(400, f"{self.server.params.server_detector} has no soft output")
+        if len(samples) == 0:
+            return self.reply_error(400, "no samples")
+
+        try:
+            bits, prob = self.server.batcher.submit(samples, input_kind)
+        except ValueError as error:
+            return self.reply_error(400, str(error))
+        except Exception as error:
+            return self.reply_error(500, f"decode failed: {error}")
+
+        if binary:
+            payload = bits.astype(np.uint8).tobytes()
+            if soft:
+                payload += prob.astype('<f4').tobytes()
+            self.reply(200, "application/octet-stream", payload)
+        else:
+            answer = {'bits': bits.astype(int).tolist()}
+            if soft:
+                answer['soft'] = prob.tolist()
+            self.reply(200, "application/json", json.dumps(answer).encode())
+
+    def reply(self, status, content_type, payload):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def reply_error(self, status, message):
+        self.reply(status, "application/json", json.dumps({'error': message}).encode())
+
+    def address_string(self):
+        # unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else self.server.server_address
+
+    def log_message(self, format, *args):
+        pass
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(params:Params, device):
+    detect, supports_soft = build_detector(params, device)
+    if params.server_socket:
+        if os.path.exists(params.server_socket):
+            os.remove(params.server_socket)
+        server = ThreadingUnixHTTPServer(params.server_socket, Decode_Handler)
+    else:
+        server = ThreadingHTTPServer((params.server_host, params.server_port), Decode_Handler)
+    server.params = params
+    server.supports_soft = supports_soft
+    server.batcher = Decode_Batcher(params, detect)
+    return server
+
+def decode_server():
+    params = Params()
+
+    # device
+    device = default_device()
+
+    server = make_server(params, device)
+    check_batching(server.batcher)
+    if params.server_socket:
+        print(f"decode server of {params.server_detector} listening on {params.server_socket}")
+    else:
+        print(f"decode server of {params.server_detector} listening on http://{params.server_host}:{params.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    decode_server()
@@ -0,0 +1,205 @@
+import numpy as np
+import sys
+import os
+import copy
+import json
+import time
+import contextlib
+
+from Model_Registry import get_spec, build_model, default_device
+from Classifier_Compare import Detector_Harness
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__))))
+from lib.Params import Params
+sys.path.pop()
+
+@contextlib.contextmanager
+def set_threads(num_threads):
+    '''
+    threads of torch, the blas libraries and openmp (xgboost) inside the with block,
+    only those of torch without threadpoolctl
+    '''
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        threadpool_limits = None
+    limits = threadpool_limits(num_threads) if threadpool_limits else contextlib.nullcontext()
+    torch = sys.modules.get('torch')
+    torch_threads = torch.get_num_threads() if torch else None
+    with limits:
+        if torch:
+            torch.set_num_threads(num_threads)
+        try:
+            yield
+        finally:
+            if torch:
+                torch.set_num_threads(torch_threads)
+
+def detector_size(harness:Detector_Harness, name, x):
+    '''
+    Input: harness, registered detector name, (1, length) equalizer input
+    Output: number of parameters, floating point operations per decoded bit
+    Mapping: nn models are counted by torch while decoding x, the others are
+    estimated from their structure; the PR equalizer counts for prml; an
+    exported numpy model counts its dense layers, a frozen model is counted
+    as the float model it was exported from
+    '''
+    params = harness.params
+    if name == "prml":
+        taps = harness.pr_adaptive_equalizer.equalizer_coeffs.size
+        num_trans = harness.viterbi_detector.trans_from.shape[0]
+        # per sample and transition: difference, square, metric sum and compare,
+        # each sample is detected again in the overlap of the next block
+        reuse = (params.eval_length + params.overlap_length) / params.eval_length
+        return taps + num_trans, 2*taps + 4*num_trans*reuse
+
+    model = harness.models[name]
+    from Numpy_Runtime import Numpy_Model
+    if isinstance(model, Numpy_Model):
+        # a multiply and an add per weight
+        num_weights = sum(weight.size for weight, _ in model.weights)
+        return num_weights + sum(bias.size for _, bias in model.weights), 2*num_weights
+    if get_spec(name).is_nn:
+        import torch
+        from torch.utils.flop_counter import FlopCounterMode
+        from BaseModel import Frozen_Model
+        detect, _ = harness.detectors[name]
+        if isinstance(model, Frozen_Model):
+            # the int8 weights are packed and the float ones folded into constants, neither are parameters
+            params_float = copy.copy(params)
+            params_float.model_arch = name
+            model, _ = build_model(params_float, torch.device("cpu"))
+            model.eval()
+            detect = lambda signal: model.decode_record(signal, torch.device("cpu"))
+        with FlopCounterMode(display=False) as flop_counter:
+            detect(x)
+        return sum(p.numel() for p in model.parameters()), flop_counter.get_total_flops() / x.shape[1]
+    if name == "lr":
+        lr_model = model.lr_model
+        return lr_model.coef_.size + lr_model.intercept_.size, 2*lr_model.coef_.size
+    if name == "xgboost":
+        # one comparison per tree level down to the leaf
+        trees = model.xgb_model.get_dump()
+        leaf_depths = [len(line) - len(line.lstrip('\t')) for tree in trees
+                       for line in tree.splitlines() if 'leaf=' in line]
+        num_nodes = sum(len(tree.splitlines()) for tree in trees)
+        return num_nodes, len(trees)*(np.mean(leaf_depths) + 1)
+    return None, None
+
+def time_decode(harness:Detector_Harness, name, x, repeats):
+    '''
+    output: seconds of the fastest of repeats decodes of the (batch, length) equalizer input x,
+    building the detector input (equalizer output, sliding windows) included
+    '''
+    detect, needs = harness.detectors[name]
+    detect(harness.detector_inputs(x, {needs})[needs]) # warm-up
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        detect(harness.detector_inputs(x, {needs})[needs])
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+def reference_bers(params:Params, detectors, device):
+    '''
+    output: {name: [ber at every params.pareto_snrs]} on pareto_info_len bits per snr
+    '''
+    bers = {name: [] for name in detectors}
+    for snr in params.pareto_snrs:
+        params_snr = copy.copy(params)
+        params_snr.snr_start, params_snr.snr_stop, params_snr.snr_step = snr, snr, 1
+        params_snr.eval_info_len = params.pareto_info_len
+        harness = Detector_Harness(params_snr)
+        register(harness, detectors, device)
+        results = harness.run()
+        for name in detectors:
+            bers[name].append(results[f"{name}_ber"][0])
+    return bers
+
+def register(harness:Detector_Harness, detectors, device):
+    for name in detectors:
+        if name == "prml":
+            harness.register_prml()
+        else:
+            harness.register_model(name, device)
+
+def pareto_front(costs, bers):
+    '''
+    Input: {name: cost}, {name: ber}
+    Output: names no other detector beats in both cost and ber, by increasing cost
+    '''
+    front = []
+    for name in costs:
+        dominated = any(costs[other] <= costs[name] and bers[other] <= bers[name]
+                        and (costs[other] < costs[name] or bers[other] < bers[name])
+                        for other in costs if other != name)
+        if not dominated:
+            front.append(name)
+    return sorted(front, key=lambda name: costs[name])
+
+def pareto_sys():
+    params = Params()
+
+    # device
+    device = default_device()
+
+    detectors = []
+    for name in params.compare_detectors:
+        if name == "prml" or os.path.isfile(get_spec(name).model_path(params)):
+            detectors.append(name)
+        else:
+            print(f"=> skip {name}, no model found at '{get_spec(name).model_path(params)}'")
+
+    bers = reference_bers(params, detectors, device)
+
+    # costs on random equalizer inputs, decode time does not depend on the samples
+    harness = Detector_Harness(params)
+    register(harness, detectors, device)
+    x = np.random.randn(max(params.pareto_batches), params.pareto_length)
+
+    results = []
+    for name in detectors:
+        num_params, flops_per_bit = detector_size(harness, name, x[:1])
+        result = {
+            'detector': name,
+            'num_params': num_params,
+            'flops_per_bit': flops_per_bit,
+            'ber': dict(zip(map(str, params.pareto_snrs), bers[name])),
+            'throughput': []
+        }
+        for num_threads in params.pareto_threads:
+            with set_threads(num_threads):
+                for batch in params.pareto_batches:
+                    seconds = time_decode(harness, name, x[:batch], params.pareto_repeats)
+                    result['throughput'].append({
+                        'threads': num_threads,
+                        'batch': batch,
+                        'bits_per_s': batch*params.pareto_length / seconds
+                    })
+        # a single record on the fewest threads
+        single = next(t for t in result['throughput']
+                      if t['threads'] == min(params.pareto_threads) and t['batch'] == min(params.pareto_batches))
+        result['latency_us_per_bit'] = 1e6 / single['bits_per_s']
+        results.append(result)
+        print(f"{name:>12}: {result['latency_us_per_bit']:.4g} us/bit, "
+              f"{max(t['bits_per_s'] for t in result['throughput']):.4g} bits/s at best, "
+              f"{num_params} params, {flops_per_bit} flops/bit, ber {bers[name]}")
+
+    # pareto fronts of every cost against the ber at every reference snr
+    fronts = {}
+    for cost in ('latency_us_per_bit', 'flops_per_bit'):
+        for snr in params.pareto_snrs:
+            costs = {result['detector']: result[cost] for result in results if result[cost] is not None}
+            front = pareto_front(costs, {result['detector']: result['ber'][str(snr)] for result in results})
+            fronts[f"{cost}_vs_ber_at_{snr}"] = front
+            print(f"pareto front of {cost} and ber at snr {snr}: {' < '.join(front)}")
+
+    with open(params.pareto_result_file, "w") as file:
+        json.dump({'detectors': results, 'pareto_fronts': fronts}, file, indent=1)
+    print(f"pareto data have save to {params.pareto_result_file}")
+
+if __name__ == '__main__':
+    np.random.seed(12345)
+    pareto_sys()
@@ -22,7 +22,10 @@ class LR(object):
         lr_model.fit(X_train, y_train)
         self.lr_model = lr_model
 
-    def decode(self, eval_length, X_val):
+    def decode(self, eval_length, X_val, soft=False):
+        if soft:
+            y_pred = self.lr_model.predict_proba(X_val)[:, 1]
+            return np.array(y_pred[:eval_length]).reshape(1, -1)
         y_pred = self.lr_model.predict(X_val)
         y_val = codeword_threshold(y_pred)[:eval_length]
         y_val = np.array(y_val).reshape(1, -1)
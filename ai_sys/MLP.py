@@ -15,7 +15,7 @@ class MLP(BaseModel):
     def __init__(self, params:Params, device):
         super(MLP, self).__init__(params, device)
         
-        self.dec_input = nn.Sequential(nn.Linear(params.input_size, params.mlp_d_model), 
+        self.dec_input = nn.Sequential(self.input_layer(params.mlp_d_model), 
                                        nn.ReLU(),
                                        nn.Dropout(params.mlp_dropout_ratio))
         self.dec_mlp = nn.Sequential(nn.Linear(params.mlp_d_model, params.mlp_hidden_size), 
@@ -27,8 +27,6 @@ class MLP(BaseModel):
         
         x_bt_size = x.shape[0]
         
-        x = x.reshape(-1, self.params.input_size)
-               
         x = self.dec_input(x)
         
         x = self.dec_mlp(x)
@@ -0,0 +1,108 @@
+import numpy as np
+import sys
+import os
+import copy
+import json
+import torch
+import torch.nn as nn
+
+from Model_Registry import get_spec, load_model
+from BaseModel import BaseModel, Frozen_Model, Causal_Linear
+from Classifier_Compare import Detector_Harness
+from Detector_Pareto import time_decode
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__))))
+from lib.Params import Params
+sys.path.pop()
+
+def fold_batch_norms(model):
+    '''
+    fold every batch norm into the convolution before it, for the modules knowing how
+    '''
+    for module in model.modules():
+        if hasattr(module, 'fold_bn'):
+            module.fold_bn()
+    return model
+
+def quantizable_layers(model):
+    '''
+    output: names of the Linear and GRU layers dynamic int8 quantization replaces;
+    the layers of a TransformerEncoderLayer stay float, its fused fast path
+    reads their weights directly, as the convolution of a Causal_Linear does
+    '''
+    encoder_layers = [name for name, module in model.named_modules()
+                      if isinstance(module, nn.TransformerEncoderLayer)]
+    return {name for name, module in model.named_modules()
+            if isinstance(module, (nn.Linear, nn.GRU)) and not isinstance(module, Causal_Linear)
+            and not any(name.startswith(f"{layer}.") for layer in encoder_layers)}
+
+def freeze_model(model, params:Params):
+    '''
+    Input: trained float model on the cpu, in eval mode
+    Output: frozen TorchScript module of its forward on (num_block, block_length, input_size) blocks,
+    (num_block, block_length) with params.raw_input
+    Mapping: batch norms folded, Linear/GRU layers int8 with params.export_quantize,
+    traced on zero blocks and frozen
+    '''
+    model = fold_batch_norms(copy.deepcopy(model))
+    if params.export_quantize:
+        model = torch.ao.quantization.quantize_dynamic(model, quantizable_layers(model), dtype=torch.qint8)
+    block_length = params.eval_length + params.overlap_length
+    if params.raw_input:
+        example = torch.zeros((2, block_length))
+    else:
+        example = torch.zeros((2, block_length, params.input_size))
+    with torch.no_grad():
+        # the trace check fails on the transformer, whose fast path differs between two runs
+        traced = torch.jit.trace(model, example, check_trace=False)
+    return torch.jit.freeze(traced)
+
+def export_sys():
+    params = Params()
+    params.use_frozen_model = False
+
+    # the int8 layers run on the cpu only
+    device = torch.device("cpu")
+
+    spec = get_spec(params.model_arch)
+    if not spec.is_nn:
+        raise ValueError(f"only nn models are exported, model_arch is {params.model_arch}")
+    model, _ = load_model(params, device)
+    if type(model).decode_record is not BaseModel.decode_record:
+        print(f"=> skip {params.model_arch}, it does not decode a record block after block")
+        return
+    frozen_model = Frozen_Model(params, freeze_model(model, params))
+
+    # the frozen model must keep the ber of the float model on the same records
+    bers = {'float': [], 'frozen': []}
+    for snr in params.export_snrs:
+        params_snr = copy.copy(params)
+        params_snr.snr_start, params_snr.snr_stop, params_snr.snr_step = snr, snr, 1
+        params_snr.eval_info_len = params.export_info_len
+        harness = Detector_Harness(params_snr)
+        harness.register('float', lambda x: model.decode_record(x, device), 'signal')
+        harness.register('frozen', lambda x: frozen_model.decode_record(x, device), 'signal')
+        results = harness.run()
+        for name in bers:
+            bers[name].append(results[f"{name}_ber"][0])
+
+    x = np.random.randn(8, 20000)
+    for name in bers:
+        seconds = time_decode(harness, name, x, 3)
+        print(f"{name:>8}: ber {bers[name]} at snrs {params.export_snrs}, {x.size / seconds:.4g} bits/s")
+
+    if any(frozen > ber + params.export_ber_tolerance for frozen, ber in zip(bers['frozen'], bers['float'])):
+        print(f"=> skip saving, the frozen model loses more than {params.export_ber_tolerance} of ber")
+        return
+    frozen_path = spec.frozen_path(params)
+    torch.jit.save(frozen_model.module, frozen_path)
+    # load_model falls back to the float model once the checkpoint or params no longer match
+    with open(spec.frozen_info_path(params), "w") as file:
+        json.dump(spec.export_info(params), file, indent=1)
+    print(f"frozen model have save to {frozen_path}, set Params.use_frozen_model to use it")
+
+if __name__ == '__main__':
+    np.random.seed(12345)
+    export_sys()
@@ -0,0 +1,186 @@
+import sys
+import os
+import json
+import hashlib
+import importlib
+
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__))))
+from lib.Params import Params
+sys.path.pop()
+
+## Model_Spec: how one model_arch is built, stored and decoded
+class Model_Spec(object):
+    '''
+    module, class_name: where the model class lives, imported on first use
+    model_file: file name of the trained model in params.model_dir
+    checkpoint: 'torch' for a torch.save dict holding the state_dict,
+                'native' for the model's own save_model/load_model
+    decode: 'record' for decode_record(x, device) on (batch, length) equalizer inputs,
+            'features' for decode(num_samples, X) on (num_samples, input_size) windows
+    '''
+    def __init__(self, name, module, class_name, model_file, checkpoint, decode):
+        self.name = name
+        self.module = module
+        self.class_name = class_name
+        self.model_file = model_file
+        self.checkpoint = checkpoint
+        self.decode = decode
+
+    @property
+    def is_nn(self):
+        return self.checkpoint == 'torch'
+
+    def model_class(self):
+        return getattr(importlib.import_module(self.module), self.class_name)
+
+    def build(self, params:Params, device=None):
+        if self.is_nn:
+            if params.torch_threads:
+                import torch
+                torch.set_num_threads(params.torch_threads)
+            return self.model_class()(params, device).to(device)
+        return self.model_class()(params)
+
+    def model_path(self, params:Params):
+        return f"{params.model_dir}/{self.model_file}"
+
+    def frozen_path(self, params:Params):
+        return f"{params.model_dir}/{self.name}_frozen.pt"
+
+    def frozen_info_path(self, params:Params):
+        return f"{params.model_dir}/{self.name}_frozen.json"
+
+    def export_info(self, params:Params):
+        '''
+        what an exported model depends on: the sha256 of the checkpoint it
+        was exported from, None without one, and the params its input is shaped by
+        '''
+        model_path = self.model_path(params)
+        checkpoint = None
+        if os.path.isfile(model_path):
+            with open(model_path, 'rb') as file:
+                checkpoint = hashlib.sha256(file.read()).hexdigest()
+        return {'checkpoint': checkpoint, 'raw_input': params.raw_input, 'input_size': params.input_size}
+
+    def export_mismatch(self, params:Params, info_path):
+        '''
+        output: why the exported model of the export_info in info_path does not match
+        the checkpoint and params, None when it does
+        '''
+        if not os.path.isfile(info_path):
+            return f"has no '{info_path}'"
+        with open(info_path) as file:
+            export_info = json.load(file)
+        info = self.export_info(params)
+        if export_info.get('checkpoint') != info['checkpoint']:
+            return f"was exported from another '{self.model_path(params)}'"
+        for key in ('raw_input', 'input_size'):
+            if export_info.get(key) != info[key]:
+                return f"was exported with {key} {export_info.get(key)}, params have {info[key]}"
+        return None
+
+    def load_frozen(self, params:Params):
+        import torch
+        from BaseModel import Frozen_Model
+        frozen_path = self.frozen_path(params)
+        print("=> loading frozen model '{}'".format(frozen_path))
+        return Frozen_Model(params, torch.jit.load(frozen_path, map_location="cpu")).eval()
+
+    def numpy_path(self, params:Params):
+        return f"{params.model_dir}/{self.name}_numpy.npz"
+
+    def numpy_info_path(self, params:Params):
+        return f"{params.model_dir}/{self.name}_numpy.json"
+
+    def numpy_usable(self, params:Params):
+        '''
+        whether load_model loads the numpy model, callers choose their device and decoding by it
+        '''
+        return (params.use_numpy_model and os.path.isfile(self.numpy_path(params))
+                and self.export_mismatch(params, self.numpy_info_path(params)) is None)
+
+    def load_numpy(self, params:Params):
+        import numpy as np
+        from Numpy_Runtime import Numpy_Model
+        numpy_path = self.numpy_path(params)
+        print("=> loading numpy model '{}'".format(numpy_path))
+        with np.load(numpy_path) as layers:
+            return Numpy_Model(params, dict(layers))
+
+    def load(self, model, params:Params):
+        '''
+        load the trained model from params.model_dir, a missing torch checkpoint
+        leaves the model untrained
+        '''
+        model_path = self.model_path(params)
+        if not self.is_nn:
+            model.load_model(model_path)
+            return model
+
+        import torch
+        if os.path.isfile(model_path):
+            print("=> loading checkpoint '{}'".format(model_path))
+            checkpoint = torch.load(model_path, weights_only=False)
+            model.load_state_dict(checkpoint['state_dict'])
+        else:
+            print("=> no checkpoint found at '{}'".format(model_path))
+        model.eval()
+        return model
+
+model_specs = {}
+
+def register_model(name, module, class_name, model_file, checkpoint='torch', decode='record'):
+    model_specs[name] = Model_Spec(name, module, class_name, model_file, checkpoint, decode)
+
+def get_spec(model_arch):
+    if model_arch not in model_specs:
+        raise ValueError(f"unknown model_arch {model_arch}, registered are {list(model_specs)}")
+    return model_specs[model_arch]
+
+def build_model(params:Params, device=None):
+    '''
+    untrained params.model_arch
+    output: model, spec
+    '''
+    spec = get_spec(params.model_arch)
+    return spec.build(params, device), spec
+
+def load_model(params:Params, device=None):
+    '''
+    build params.model_arch and load it from params.model_dir, or with
+    params.use_frozen_model or params.use_numpy_model the exported model when there is one;
+    an exported model stale against the checkpoint or params is not used
+    output: model, is_nn
+    '''
+    spec = get_spec(params.model_arch)
+    if params.use_numpy_model and os.path.isfile(spec.numpy_path(params)):
+        mismatch = spec.export_mismatch(params, spec.numpy_info_path(params))
+        if mismatch is None:
+            return spec.load_numpy(params), spec.is_nn
+        print(f"=> numpy model '{spec.numpy_path(params)}' {mismatch}, skip it")
+    if spec.is_nn and params.use_frozen_model and os.path.isfile(spec.frozen_path(params)):
+        mismatch = spec.export_mismatch(params, spec.frozen_info_path(params))
+        if mismatch is None:
+            return spec.load_frozen(params), True
+        print(f"=> frozen model '{spec.frozen_path(params)}' {mismatch}, loading the float model")
+    model, spec = build_model(params, device)
+    return spec.load(model, params), spec.is_nn
+
+def default_device():
+    import torch
+    os.environ['CUDA_VISIBLE_DEVICES'] = "0"
+    if torch.cuda.is_available():
+        return torch.device("cuda")
+    return torch.device("cpu")
+
+register_model("lr", "LR", "LR", "lr_model.joblib", checkpoint='native', decode='features')
+register_model("xgboost", "XGBoost", "XGBoost", "xgb_model.json", checkpoint='native', decode='features')
+register_model("mlp", "MLP", "MLP", "mlp.pth.tar")
+register_model("cnn", "CNN", "CNN", "cnn.pth.tar")
+register_model("unet", "Unet1D", "UNet1D", "unet.pth.tar")
+register_model("rnn", "RNN", "RNN", "rnn.pth.tar")
+register_model("rnn_stream", "Stream_RNN", "Stream_RNN", "rnn_stream.pth.tar")
+register_model("transformer", "Transformer", "Transformer", "transformer.pth.tar")
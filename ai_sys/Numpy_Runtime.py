@@ -0,0 +1,168 @@
+import numpy as np
+import sys
+import os
+import json
+
+from Model_Registry import get_spec, load_model
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__))))
+from lib.Utils import sliding_shape
+from lib.Params import Params
+sys.path.pop()
+
+numpy_archs = ("mlp", "cnn", "lr")
+
+def numpy_layers(model, model_arch):
+    '''
+    Input: trained MLP, CNN or LR model
+    Output: dict of float32 arrays, weight w<i> and bias b<i> of every dense layer
+    and relu, whether a ReLU follows each layer
+    Mapping: the conv of the CNN sees a single time step, only its center tap is kept
+    '''
+    def array(parameter):
+        return parameter.detach().cpu().numpy().astype(np.float32)
+
+    if model_arch == "mlp":
+        layers = [(model.dec_input[0], True), (model.dec_mlp[0], True), (model.dec_output, False)]
+        weights = [(array(layer.weight), array(layer.bias), relu) for layer, relu in layers]
+    elif model_arch == "cnn":
+        conv = model.dec_cnn[0]
+        # 'same' padding puts the input step at tap (kernel_size - 1)//2
+        tap = (conv.kernel_size[0] - 1) // 2
+        weights = [(array(model.dec_input.weight), array(model.dec_input.bias), False),
+                   (array(conv.weight[:, :, tap]), array(conv.bias), True),
+                   (array(model.dec_output.weight), array(model.dec_output.bias), False)]
+    elif model_arch == "lr":
+        lr_model = model.lr_model
+        weights = [(lr_model.coef_.astype(np.float32), lr_model.intercept_.astype(np.float32), False)]
+    else:
+        raise ValueError(f"only {numpy_archs} run on numpy, model_arch is {model_arch}")
+
+    layers = {'relu': np.array([relu for _, _, relu in weights])}
+    for idx, (weight, bias, _) in enumerate(weights):
+        layers[f"w{idx}"], layers[f"b{idx}"] = weight, bias
+    return layers
+
+## Numpy_Model: an exported MLP, CNN or LR decoded with numpy alone
+class Numpy_Model(object):
+    '''
+    Every decision depends on the input_size window ending at its sample only,
+    so a record is decoded sample by sample without cutting overlapping blocks;
+    the windows are zeroed before every block start as the blocks of decode_record are
+    '''
+    def __init__(self, params:Params, layers):
+        self.params = params
+        self.relu = layers['relu']
+        self.weights = [(layers[f"w{idx}"], layers[f"b{idx}"]) for idx in range(len(self.relu))]
+
+    def forward(self, x):
+        '''
+        Input: (num_samples, input_size) float32 array
+        Output: (num_samples,) probabilities of a 1
+        '''
+        for (weight, bias), relu in zip(self.weights, self.relu):
+            x = x @ weight.T + bias
+            if relu:
+                np.maximum(x, 0, out=x)
+        return 1 / (1 + np.exp(-x[:, 0]))
+
+    def decode(self, eval_length, X_val, soft=False):
+        '''
+        Input: (num_samples, input_size) windows
+        Output: (1, eval_length) numpy array, as LR.decode
+        '''
+        prob = self.forward(np.asarray(X_val, dtype=np.float32).reshape(-1, self.params.input_size))[:eval_length]
+        if not soft:
+            prob = (prob > 0.5).astype(np.float64)
+        return prob.reshape(1, -1)
+
+    def decode_record(self, x, device=None, batch_size=None, soft=False):
+        '''
+        Input: (batch, length) numpy array of equalizer inputs, device is ignored
+        Output: (batch, length) numpy array
+        Mapping: forward in chunks of batch_size*eval_length samples
+        '''
+        params = self.params
+        batch_size = batch_size or params.decode_batch_size
+        batch, length = x.shape
+        windows = sliding_shape(x, params.input_size)
+        # window entries before the start of their block are the zero padding of that block
+        in_block = (np.arange(length) % params.eval_length)[:, None] + np.arange(params.input_size) >= params.input_size - 1
+
+        dec = np.empty((batch, length))
+        chunk = batch_size*params.eval_length
+        for row in range(batch):
+            for pos in range(0, length, chunk):
+                features = windows[row, pos:pos+chunk] * in_block[pos:pos+chunk]
+                dec[row, pos:pos+chunk] = self.forward(features)
+        if not soft:
+            dec = (dec > 0.5).astype(np.float64)
+        return dec
+
+    def decode_blocks(self, x, block_idx, device=None, batch_size=None, soft=False):
+        '''
+        Input: (batch, length) numpy array of equalizer inputs, indices of blocks
+        counted row after row as in decode_record, device is ignored
+        Output: (len(block_idx), eval_length) numpy array
+        Mapping: decode_record of the selected blocks only, their windows zero padded in front
+        '''
+        params = self.params
+        eval_length = params.eval_length
+        batch_size = batch_size or params.decode_batch_size
+        batch, length = x.shape
+        num_block = -(-length // eval_length)
+        x_pad = np.zeros((batch, num_block*eval_length))
+        x_pad[:, :length] = x
+        blocks = x_pad.reshape(-1, eval_length)[np.asarray(block_idx, dtype=np.int64)]
+
+        dec = np.empty(blocks.shape)
+        for idx in range(0, len(blocks), batch_size):
+            windows = sliding_shape(blocks[idx:idx+batch_size], params.input_size)
+            dec[idx:idx+batch_size] = self.forward(windows.reshape(-1, params.input_size)).reshape(-1, eval_length)
+        if not soft:
+            dec = (dec > 0.5).astype(np.float64)
+        return dec
+
+def numpy_sys():
+    params = Params()
+    params.use_numpy_model = False
+
+    spec = get_spec(params.model_arch)
+    device = None
+    if spec.is_nn:
+        import torch
+        device = torch.device("cpu")
+    model, _ = load_model(params, device)
+    layers = numpy_layers(model, params.model_arch)
+    numpy_model = Numpy_Model(params, layers)
+
+    # the numpy model must reproduce the decisions of the loaded model
+    x = np.random.randn(2, 20000)
+    prob = numpy_model.decode_record(x, soft=True)
+    if spec.decode == 'record':
+        reference = model.decode_record(x, device, soft=True)
+    else:
+        # block after block, as Classifier_Infer decodes the per-sample classifiers
+        reference = np.array([np.concatenate([
+            model.decode(params.eval_length, sliding_shape(x[row:row+1, pos:pos+params.eval_length], params.input_size)[0], soft=True)
+            for pos in range(0, x.shape[1], params.eval_length)], axis=1)[0] for row in range(len(x))])
+    max_diff = np.abs(prob - reference).max()
+    num_differ = np.count_nonzero((prob > 0.5) != (reference > 0.5))
+    print(f"max probability difference {max_diff:.3g}, {num_differ} decisions differ")
+
+    if num_differ or max_diff > params.numpy_prob_tolerance:
+        print(f"=> skip saving, the numpy model differs from {params.model_arch} by more than {params.numpy_prob_tolerance}")
+        return
+
+    numpy_path = spec.numpy_path(params)
+    np.savez(numpy_path, **layers)
+    # load_model skips the numpy model once the checkpoint or params no longer match
+    with open(spec.numpy_info_path(params), "w") as file:
+        json.dump(spec.export_info(params), file, indent=1)
+    print(f"numpy model have save to {numpy_path}, set Params.use_numpy_model to use it")
+
+if __name__ == '__main__':
+    np.random.seed(12345)
+    numpy_sys()
@@ -14,7 +14,7 @@ sys.path.pop()
 class RNN(BaseModel):
     def __init__(self, params:Params, device):
         super(RNN, self).__init__(params, device)
-        self.dec_input = nn.Linear(params.input_size, params.rnn_d_model)
+        self.dec_input = self.input_layer(params.rnn_d_model)
         self.dec_rnn = nn.GRU(params.rnn_d_model, 
                                     params.rnn_hidden_size, 
                                     params.rnn_layer, 
@@ -0,0 +1,122 @@
+import sys
+import os
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from BaseModel import BaseModel
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__))))
+from lib.Params import Params
+from lib.Utils import codeword_threshold
+sys.path.pop()
+
+## Stream_RNN: forward GRU carried across chunks, backward GRU over a bounded lookahead
+class Stream_RNN(BaseModel):
+    '''
+    The forward GRU runs once over the whole stream with its hidden state
+    carried from chunk to chunk. For every eval_length samples, the backward GRU
+    runs over these samples plus rnn_lookahead samples that follow them.
+    Each sample is processed about (eval_length + rnn_lookahead) / eval_length
+    times, compared with (eval_length + overlap_length) / eval_length times
+    for the bidirectional RNN.
+    '''
+    def __init__(self, params:Params, device):
+        super(Stream_RNN, self).__init__(params, device)
+        self.lookahead = params.rnn_lookahead
+        self.dec_input = self.input_layer(params.rnn_d_model)
+        self.dec_rnn = nn.GRU(params.rnn_d_model,
+                              params.rnn_hidden_size,
+                              params.rnn_layer,
+                              bias=True,
+                              batch_first=True,
+                              dropout=params.rnn_dropout_ratio)
+        self.dec_rnn_backward = nn.GRU(params.rnn_hidden_size,
+                                       params.rnn_hidden_size,
+                                       1,
+                                       bias=True,
+                                       batch_first=True)
+
+        self.dec_output = nn.Linear(2*params.rnn_hidden_size, params.output_size)
+
+    def forward(self, x):
+        # a training block is the start of a stream that ends after it,
+        # followed by zero windows whose input layer output is its bias
+        x = self.dec_input(x)
+        x = torch.cat((x, self.dec_input.bias.expand(x.shape[0], self.lookahead, -1)), 1)
+        x, _ = self.forward_stream(x)
+        return x
+
+    def forward_stream(self, x, h=None):
+        '''
+        Input: (batch, time_step + rnn_lookahead, rnn_d_model) input layer output, forward GRU state or None
+        Output: (batch, time_step) probabilities, forward GRU state after time_step samples
+        Mapping: the last rnn_lookahead samples only feed the backward GRU,
+        the next call starts with them
+        '''
+        eval_length = self.params.eval_length
+        time_step = x.shape[1] - self.lookahead
+        x_forward, h = self.dec_rnn(x[:, :time_step, :], h)
+        x_backward = x_forward
+        if self.lookahead:
+            # the GRU rejects an empty sequence, without lookahead the backward GRU sees the chunk alone
+            x_lookahead, _ = self.dec_rnn(x[:, time_step:, :], h)
+            x_backward = torch.cat((x_forward, x_lookahead), 1)
+
+        # backward GRU windows of eval_length + rnn_lookahead starting every eval_length samples
+        num_chunk = -(-time_step // eval_length)
+        x_backward = F.pad(x_backward, (0, 0, 0, num_chunk*eval_length - time_step))
+        x_backward = x_backward.unfold(1, eval_length + self.lookahead, eval_length)
+        x_backward = x_backward.permute(0, 1, 3, 2).reshape(-1, eval_length + self.lookahead, x_forward.shape[2])
+        x_backward, _ = self.dec_rnn_backward(torch.flip(x_backward, [1]))
+        x_backward = torch.flip(x_backward, [1])[:, :eval_length, :]
+        x_backward = x_backward.reshape(x.shape[0], num_chunk*eval_length, -1)[:, :time_step, :]
+
+        x = self.dec_output(torch.cat((x_forward, x_backward), 2))
+
+        x = torch.sigmoid(x)
+
+        x = torch.squeeze(x, 2)
+
+        return x, h
+
+    def decode_record(self, x, device, batch_size=None, soft=False):
+        '''
+        Input: (batch, length) numpy array of equalizer inputs
+        Output: (batch, length) numpy array
+        Mapping: the record is cut into lanes of rnn_lane_length samples decoded in
+        parallel, the forward GRU of every lane starts overlap_length samples early
+        so that its state has settled; batch_size*eval_length samples per forward pass;
+        soft=True keeps the probabilities instead of the decided bits
+        '''
+        params = self.params
+        eval_length = params.eval_length
+        lane_length = params.rnn_lane_length
+        warm_up = -(-params.overlap_length // eval_length)*eval_length
+        lane_input_length = warm_up + lane_length + self.lookahead
+        lanes_per_batch = max((batch_size or params.decode_batch_size)*eval_length // lane_input_length, 1)
+        batch, length = x.shape
+        num_lane = -(-length // lane_length)
+
+        # raw samples of every lane, with the input_size - 1 samples its first window needs
+        x_pad = torch.zeros((batch, params.input_size - 1 + warm_up + num_lane*lane_length + self.lookahead))
+        x_pad[:, params.input_size - 1 + warm_up:params.input_size - 1 + warm_up + length] = torch.from_numpy(x)
+        lanes = x_pad.unfold(1, params.input_size - 1 + lane_input_length, lane_length).reshape(-1, params.input_size - 1 + lane_input_length)
+
+        dec = torch.empty((lanes.shape[0], lane_length), device=device)
+        with torch.inference_mode():
+            for idx in range(0, lanes.shape[0], lanes_per_batch):
+                if params.raw_input:
+                    # the first input_size - 1 samples only fill the first windows
+                    x_lanes = self.dec_input(lanes[idx:idx + lanes_per_batch].to(device))[:, params.input_size - 1:, :]
+                else:
+                    x_lanes = self.dec_input(lanes[idx:idx + lanes_per_batch].to(device).unfold(1, params.input_size, 1))
+                dec_lanes, _ = self.forward_stream(x_lanes)
+                dec[idx:idx + lanes_per_batch] = dec_lanes[:, warm_up:]
+            if not soft:
+                dec = codeword_threshold(dec)
+
+        return dec.reshape(batch, -1)[:, :length].cpu().numpy().astype(np.float64)
@@ -14,7 +14,7 @@ sys.path.pop()
 class Transformer(BaseModel):
     def __init__(self, params:Params, device):
         super(Transformer, self).__init__(params, device)
-        self.dec_input = nn.Linear(params.input_size, params.transformer_d_model)
+        self.dec_input = self.input_layer(params.transformer_d_model)
         transformer = nn.Transformer(
                                     d_model=params.transformer_d_model, 
                                     nhead=params.transformer_nhead, 
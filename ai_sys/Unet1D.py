@@ -3,6 +3,7 @@ import os
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 
 from BaseModel import BaseModel
 sys.path.append(
@@ -30,6 +31,13 @@ class Conv1d_bn(nn.Module):
         out = F.relu(self.bn2(self.conv2(out)))
         return out
     
+    def fold_bn(self):
+        # inference only: the batch norms become part of the convolutions before them
+        self.conv1 = fuse_conv_bn_eval(self.conv1, self.bn1)
+        self.conv2 = fuse_conv_bn_eval(self.conv2, self.bn2)
+        self.bn1 = nn.Identity()
+        self.bn2 = nn.Identity()
+    
 class Deconv1d_bn(nn.Module):
     def __init__(self,in_channels,out_channels,kernel_size=2,strides=2):
         super(Deconv1d_bn,self).__init__()
@@ -42,12 +50,17 @@ class Deconv1d_bn(nn.Module):
         out = F.relu(self.bn1(self.conv1(x)))
         return out
     
+    def fold_bn(self):
+        # inference only: the batch norm becomes part of the transposed convolution
+        self.conv1 = fuse_conv_bn_eval(self.conv1, self.bn1, transpose=True)
+        self.bn1 = nn.Identity()
+    
 class UNet1D(BaseModel):
     def __init__(self, params:Params, device):
         
         super(UNet1D, self).__init__(params, device)
         
-        self.dec_input = nn.Linear(params.input_size, params.unet_d_model)
+        self.dec_input = self.input_layer(params.unet_d_model)
         
         # encoder
         self.layer1_conv = Conv1d_bn(1, params.unet_base_filters)
@@ -77,10 +90,10 @@ class UNet1D(BaseModel):
         
         x_bt_size = x.shape[0]
         
-        x = x.reshape(-1, self.params.input_size)
-        
         x = self.dec_input(x)
         
+        x = x.reshape(-1, self.params.unet_d_model)
+        
         x = torch.unsqueeze(x, 1)
         
         conv1 = self.layer1_conv(x)
@@ -40,11 +40,15 @@ class XGBoost(object):
                     verbose=True)
         self.xgb_model = xgb_model
 
-    def decode(self, eval_length, X_val):
+    def decode(self, eval_length, X_val, soft=False):
         if isinstance(self.xgb_model, xgb.Booster):
             y_pred = self.xgb_model.predict(xgb.DMatrix(X_val))
+        elif soft:
+            y_pred = self.xgb_model.predict_proba(X_val)[:, 1]
         else:
             y_pred = self.xgb_model.predict(X_val)
+        if soft:
+            return np.array(y_pred[:eval_length]).reshape(1, -1)
         y_val = codeword_threshold(y_pred)[:eval_length]
         y_val = np.array(y_val).reshape(1, -1)
         return y_val
@@ -1,7 +1,7 @@
 import numpy as np
 import sys
 import os
-np.set_printoptions(threshold=sys.maxsize)
+import copy
 
 sys.path.append(
     os.path.dirname(
@@ -14,23 +14,89 @@ from lib.Channel_Converter import NRZI_Converter
 from lib.Disk_Read_Channel import Disk_Read_Channel
 from lib.Target_PR_Channel import Target_PR_Channel
 from lib.Adaptive_Equalizer import Adaptive_Equalizer
-from lib.Utils import find_index
+from lib.Profiler import Stage_Profiler, profile_run
+from lib.Stream_Pipeline import (chain, concurrent_chain, info_source, Tee, RLL_Stage, NRZI_Stage, RF_Channel_Stage,
+                                 AWGN_Stage, Sine_Stage, FIR_Stage, Block_Detector_Stage, BER_Counter)
 sys.path.pop()
 
-np.random.seed(12345)
+def default_impairment(params:Params):
+    '''
+    the (jitteron, disturbance) impairment selected by params.jitteron/params.addsineon,
+    disturbance is None, 'addsin' or 'multiplysin'
+    '''
+    return (params.jitteron, 'addsin' if params.addsineon else None)
 
-def realistic_sys(params:Params):
+def load_equalizer_coeffs(params:Params, impairment=None):
+    '''
+    coefficients of the PR equalizer trained for the impairment channel
+    output: (1, taps_num) numpy array
+    '''
+    jitteron, disturbance = impairment or default_impairment(params)
+    if jitteron == True and disturbance == 'addsin':
+        coeffs_file = params.equalizer_coeffs_jitter_sine_file
+    elif jitteron == True and disturbance == 'multiplysin':
+        coeffs_file = params.equalizer_coeffs_jitter_multsine_file
+    elif jitteron == True and disturbance is None:
+        coeffs_file = params.equalizer_coeffs_jitter_file
+    elif jitteron == False and disturbance == 'addsin':
+        coeffs_file = params.equalizer_coeffs_sine_file
+    elif jitteron == False and disturbance == 'multiplysin':
+        coeffs_file = params.equalizer_coeffs_multsine_file
+    elif jitteron == False and disturbance is None:
+        coeffs_file = params.equalizer_coeffs_file
     
-    # constant and input paras
-    encoder_dict, encoder_definite = RLL_state_machine()
+    if disturbance == 'multiplysin' and not os.path.isfile(coeffs_file):
+        # no equalizer trained with the multiplicative sine, use the undisturbed one
+        print(f"\nno equalizer_coeffs at {coeffs_file}")
+        return load_equalizer_coeffs(params, (jitteron, None))
+    
+    equalizer_coeffs = np.loadtxt(coeffs_file).reshape(1, -1)
+    print(f"\nload equalizer_coeffs from txt files:{coeffs_file}")
+    print(f"\nequalizer_coeffs are {equalizer_coeffs}")
+    return equalizer_coeffs
+
+def prml_detector(params:Params, equalizer_coeffs=None):
+    '''
+    Viterbi detector of the target PR channel, its levels scaled with params.signal_norm,
+    and the PR equalizer with equalizer_coeffs, load_equalizer_coeffs(params) by default
+    output: viterbi_detector, pr_adaptive_equalizer
+    '''
     channel_dict = Target_channel_state_machine()
     if params.signal_norm:
         channel_dict['in_out'][:, 1] /= sum(params.PR_coefs)
-
+    
     # Initial metric 
     ini_metric = 1000 * np.ones((channel_dict['num_state'], 1))
     ini_metric[0, 0] = 0
-    ini_metric_pr = ini_metric
+    viterbi_detector = Viterbi(params, channel_dict, ini_metric)
+    
+    if equalizer_coeffs is None:
+        equalizer_coeffs = load_equalizer_coeffs(params)
+    pr_adaptive_equalizer = Adaptive_Equalizer(        
+        params = params,
+        equalizer_input  = None,
+        reference_signal = None,
+        taps_num = equalizer_coeffs.shape[1],
+        mu = 0.01
+    )
+    pr_adaptive_equalizer.equalizer_coeffs = equalizer_coeffs
+    return viterbi_detector, pr_adaptive_equalizer
+
+def ber_result_file(impairment):
+    jitteron, disturbance = impairment
+    name = "PRML"
+    if jitteron:
+        name += "_jitter"
+    if disturbance == 'addsin':
+        name += "_addsine"
+    elif disturbance == 'multiplysin':
+        name += "_multsine"
+    return f"../data/{name}_result.txt"
+
+def realistic_sys(params:Params):
+    
+    # constant and input paras
+    encoder_dict, encoder_definite = RLL_state_machine()
     
     # rate for constrained code
     num_sym_in_constrain = encoder_dict[1]['input'].shape[1]
@@ -44,32 +110,13 @@ def realistic_sys(params:Params):
     NRZI_converter = NRZI_Converter()
     disk_read_channel = Disk_Read_Channel(params)
     target_pr_channel = Target_PR_Channel(params)
-    viterbi_detector = Viterbi(params, channel_dict, ini_metric)
-    #viterbi_detector_pr = Viterbi(params, channel_dict, ini_metric)
-    
-    pr_adaptive_equalizer = Adaptive_Equalizer(        
-        equalizer_input  = None,
-        reference_signal = None,
-        taps_num = 15,
-        mu = 0.01
-    )
+    profiler = Stage_Profiler(params)
 
-    if params.jitteron == True and params.addsineon == True:
-        pr_adaptive_equalizer.equalizer_coeffs = np.loadtxt(params.equalizer_coeffs_jitter_sine_file).reshape(1, -1)
-        print(f"\nload equalizer_coeffs from txt files:{params.equalizer_coeffs_jitter_sine_file}")
-        print(f"\nequalizer_coeffs are {pr_adaptive_equalizer.equalizer_coeffs}")
-    elif params.jitteron == True and params.addsineon == False:
-        pr_adaptive_equalizer.equalizer_coeffs = np.loadtxt(params.equalizer_coeffs_jitter_file).reshape(1, -1)
-        print(f"\nload equalizer_coeffs from txt files:{params.equalizer_coeffs_jitter_file}")
-        print(f"\nequalizer_coeffs are {pr_adaptive_equalizer.equalizer_coeffs}")
-    elif params.jitteron == False and params.addsineon == True:
-        pr_adaptive_equalizer.equalizer_coeffs = np.loadtxt(params.equalizer_coeffs_sine_file).reshape(1, -1)
-        print(f"\nload equalizer_coeffs from txt files:{params.equalizer_coeffs_sine_file}")
-        print(f"\nequalizer_coeffs are {pr_adaptive_equalizer.equalizer_coeffs}")
-    elif params.jitteron == False and params.addsineon == False:
-        pr_adaptive_equalizer.equalizer_coeffs = np.loadtxt(params.equalizer_coeffs_file).reshape(1, -1)
-        print(f"\nload equalizer_coeffs from txt files:{params.equalizer_coeffs_file}")
-        print(f"\nequalizer_coeffs are {pr_adaptive_equalizer.equalizer_coeffs}")
+    # impairment combinations evaluated on the same records
+    impairments = params.impairments or [default_impairment(params)]
+    equalizer_coeffs = {impairment: load_equalizer_coeffs(params, impairment) for impairment in impairments}
+    # the coefficients of every impairment replace those of the first one
+    viterbi_detector, pr_adaptive_equalizer = prml_detector(params, equalizer_coeffs[impairments[0]])
 
     
     # define ber
@@ -79,173 +126,158 @@ def realistic_sys(params:Params):
     ber_info = np.zeros((1, num_ber))
     
     # eval mode
-    ber_list = []
-    #ber_pr_list = []
-    for idx in np.arange(0, num_ber):
-        snr = params.snr_start+idx*params.snr_step
+    # every group of snrs shares one clean record, its snr variants are derived in one broadcast
+    snr_list = params.snr_start + np.arange(0, num_ber)*params.snr_step
+    snr_group_size = params.eval_snr_group_size or num_ber
+    ber_lists = {impairment: [] for impairment in impairments}
+    for group in range(0, num_ber, snr_group_size):
+        snrs = snr_list[group:group+snr_group_size]
         
+        # encoding, ideal and jittered rf synthesis and the noise draw are shared by all impairments
         info = np.random.randint(2, size = (1, params.eval_info_len + dummy_len))
-        codeword = NRZI_converter.forward_coding(RLL_modulator.forward_coding(info))
+        with profiler.stage("rll"):
+            modulated = RLL_modulator.forward_coding(info)
+        with profiler.stage("nrzi"):
+            codeword = NRZI_converter.forward_coding(modulated)
         
-        signal_upsample_ideal, signal_upsample_jittered, rf_signal_ideal, rf_signal = disk_read_channel.RF_signal_jitter(codeword)
-
-        if params.jitteron:
-            rf_signal_input = rf_signal
-        else:
-            rf_signal_input = rf_signal_ideal
+        with profiler.stage("rf_signal"):
+            signal_upsample_ideal, signal_upsample_jittered, rf_signal_ideal, rf_signal = disk_read_channel.RF_signal_jitter(codeword)
+        
+        with profiler.stage("noise"):
+            if params.eval_shared_noise:
+                noise = np.random.normal(0, 1, codeword.shape)
+            else:
+                noise = np.random.normal(0, 1, (len(snrs), codeword.shape[1]))
 
-        equalizer_input = disk_read_channel.awgn(rf_signal_input, snr)
+        for impairment in impairments:
+            jitteron, disturbance = impairment
+            
+            if jitteron:
+                rf_signal_input = rf_signal
+            else:
+                rf_signal_input = rf_signal_ideal
 
-        if params.addsineon:
-            equalizer_input = disk_read_channel.addsin(equalizer_input)
+            with profiler.stage("awgn"):
+                equalizer_input = disk_read_channel.awgn_sweep(rf_signal_input, snrs, noise=noise)
 
-        
-        #signal_upsample_ideal, signal_upsample_jittered, pr_signal_ideal, pr_signal_real = target_pr_channel.target_channel_jitter(codeword)
-        #if params.only_awgn:
-        #    pr_signal_input = pr_signal_ideal
-        #else:
-        #    pr_signal_input = pr_signal_real
-        #pr_signal_noise = target_pr_channel.awgn(pr_signal_input, snr)
-        
-        length = equalizer_input.shape[1]
-        
-        # actually equalizer output stream data
-        pr_adaptive_equalizer.equalizer_input = equalizer_input
-        equalizer_output = pr_adaptive_equalizer.equalized_signal()
-        
-        detectword = np.empty((1, 0))
-        #detectword_pr = np.empty((1, 0))
-        for pos in range(0, length - params.overlap_length, params.eval_length):
-            
-            detector_input             = equalizer_output[:, pos:pos+params.eval_length+params.overlap_length]
-            #pr_signal_noise_truncation = pr_signal_noise[:, pos:pos+params.eval_length+params.overlap_length]
-            
-            dec_tmp, metric_next = viterbi_detector.vit_dec(detector_input, ini_metric)
-            ini_metric = metric_next
-            detectword = np.append(detectword, dec_tmp, axis=1)
-            
-            #dec_tmp_pr, metric_next_pr = viterbi_detector_pr.vit_dec(pr_signal_noise_truncation, ini_metric_pr)
-            #ini_metric_pr = metric_next_pr
-            #detectword_pr = np.append(detectword_pr, dec_tmp_pr, axis=1)
+            with profiler.stage("sine"):
+                if disturbance == 'addsin':
+                    equalizer_input = disk_read_channel.addsin(equalizer_input)
+                elif disturbance == 'multiplysin':
+                    equalizer_input = disk_read_channel.multiplysin(equalizer_input)
             
-            # # eval mode 
-            # # Guarantees that the equalizer can track changes in channel characteristics
-            # pr_adaptive_equalizer.equalizer_input  = equalizer_input_truncation
-            # pr_adaptive_equalizer.reference_signal = pr_signal_truncation
-            # detector_input_train, error_signal, error_signal_square, equalizer_coeffs = pr_adaptive_equalizer.lms()
+            # actually equalizer output stream data, one row per snr
+            with profiler.stage("equalizer"):
+                pr_adaptive_equalizer.equalizer_input = equalizer_input
+                pr_adaptive_equalizer.equalizer_coeffs = equalizer_coeffs[impairment]
+                equalizer_output = pr_adaptive_equalizer.equalized_signal()
             
-            # Normalized_t = np.linspace(0, params.eval_length+params.overlap_length -1, params.eval_length+params.overlap_length)
-            # Xs = [
-            #     Normalized_t,
-            #     Normalized_t,
-            #     Normalized_t,
-            #     Normalized_t,
-            #     Normalized_t,
-            #     Normalized_t
-            # ]
-            # Ys = [
-            #     {'data': codeword_truncation.reshape(-1), 'label': 'binary Sequence'}, 
-            #     {'data': rf_signal_truncation.reshape(-1), 'label': 'rf_signal_truncation', 'color': 'red'},
-            #     {'data': equalizer_input_truncation.reshape(-1), 'label': f'equalizer_input_truncation_snr{snr}', 'color': 'red'},
-            #     {'data': pr_signal_truncation.reshape(-1), 'label': 'pr_signal_truncation', 'color': 'red'},
-            #     {'data': detector_input.reshape(-1), 'label': 'detector_input', 'color': 'red'},
-            #     {'data': pr_signal_noise_truncation.reshape(-1), 'label': 'pr_signal_noise_truncation', 'color': 'red'},
-            # ]
-            # titles = [
-            #     'codeword_truncation',
-            #     'rf_signal_truncation',
-            #     f'equalizer_input_truncation_snr{snr}',
-            #     'pr_signal_truncation',
-            #     'detector_input',
-            #     'pr_signal_noise_truncation'
-            # ]
-            # xlabels = ["Time (t/T)"]
-            # ylabels = [
-            #     "Binary",
-            #     "Amplitude",
-            #     "Amplitude",
-            #     "Amplitude",
-            #     "Amplitude",
-            #     "Amplitude",
-            # ]
-            # plot_separated(
-            #     Xs=Xs, 
-            #     Ys=Ys, 
-            #     titles=titles,     
-            #     xlabels=xlabels, 
-            #     ylabels=ylabels
-            # )
+            # detect all snr rows at once
+            with profiler.stage("viterbi"):
+                detectword = viterbi_detector.vit_dec_record(equalizer_output)
+            # the snrs of a group are synthesized and detected together and share one point,
+            # the stages before the impairment loop count in the point of the first impairment
+            profiler.point(impairment=str(impairment), snr=" ".join(str(snr) for snr in snrs))
             
-            # Xs = [
-            #     Normalized_t,
-            #     Normalized_t,
-            #     Normalized_t,
-            #     np.arange(equalizer_coeffs.shape[1])
-            # ]
-            # Ys = [
-            #     {'data': detector_input_train.reshape(-1), 'label': 'detector_input_train', 'color': 'red'},
-            #     {'data': error_signal.reshape(-1), 'label': 'error_signal', 'color': 'red'},
-            #     {'data': error_signal_square.reshape(-1), 'label': 'error_signal_square', 'color': 'red'},
-            #     {'data': equalizer_coeffs.reshape(-1), 'label': 'equalizer_coeffs', 'color': 'red'}
-            # ]
-            # titles = [
-            #     'detector_input_train',
-            #     'error_signal',
-            #     'error_signal_square',
-            #     'equalizer_coeffs'
-            # ]
-            # xlabels = [
-            #     "Time (t/T)",
-            #     "Time (t/T)",
-            #     "Time (t/T)",
-            #     "equalizer_coeffs idx"
-            # ]
-            # ylabels = ["Amplitude"]
-            # plot_separated(
-            #     Xs=Xs, 
-            #     Ys=Ys, 
-            #     titles=titles,     
-            #     xlabels=xlabels, 
-            #     ylabels=ylabels
-            # )
-        
-        print("The SNR is:")
-        print(snr)
-        ber = (np.count_nonzero(np.abs(codeword[:, 0:codeword_len] - detectword[:, 0:codeword_len])) 
-               / codeword_len)
-        print("The bit error rate (BER) is:")
-        print(ber)
-        #ber_pr = (np.count_nonzero(np.abs(codeword[:, 0:codeword_len] - detectword_pr[:, 0:codeword_len]))
-        #       / codeword_len)
-        #print("The bit error rate (BER) in Target PR channel is:")
-        #print(ber_pr)
-        ber_list.append(ber)
-        #ber_pr_list.append(ber_pr)
+            for snr, detectword_snr in zip(snrs, detectword):
+                print(f"The impairment (jitteron, disturbance) is: {impairment}")
+                print("The SNR is:")
+                print(snr)
+                ber = (np.count_nonzero(np.abs(codeword[0, 0:codeword_len] - detectword_snr[0:codeword_len])) 
+                       / codeword_len)
+                print("The bit error rate (BER) is:")
+                print(ber)
+                ber_lists[impairment].append(ber)
 
-    if params.jitteron == True and params.addsineon == True:
-        ber_file = "../data/PRML_jitter_addsine_result.txt"
-        with open(ber_file, "w") as file:
-            for ber in ber_list:
-                file.write(f"{ber}\n")
-        print(f"ber data have save to {ber_file}")
-    elif params.jitteron == True and params.addsineon == False:
-        ber_file = "../data/PRML_jitter_result.txt"
+    for impairment, ber_list in ber_lists.items():
+        ber_file = ber_result_file(impairment)
         with open(ber_file, "w") as file:
             for ber in ber_list:
                 file.write(f"{ber}\n")
         print(f"ber data have save to {ber_file}")
-    elif params.jitteron == False and params.addsineon == True:
-        ber_file = "../data/PRML_addsine_result.txt"
-        with open(ber_file, "w") as file:
-            for ber in ber_list:
-                file.write(f"{ber}\n")
-        print(f"ber data have save to {ber_file}")
-    elif params.jitteron == False and params.addsineon == False:
-        ber_file = "../data/PRML_result.txt"
+    profiler.save()
+
+def streaming_sys(params:Params):
+    '''
+    realistic_sys on a stream of params.stream_chunk_bits info bits per chunk,
+    memory stays bounded by the chunk size instead of the record length;
+    with params.stream_workers the stages run concurrently
+    '''
+    encoder_dict, encoder_definite = RLL_state_machine()
+    
+    num_sym_in_constrain = encoder_dict[1]['input'].shape[1]
+    num_sym_out_constrain = encoder_dict[1]['output'].shape[1]
+    rate_constrain = num_sym_in_constrain / num_sym_out_constrain
+    dummy_len = int(params.overlap_length * num_sym_in_constrain 
+                 / num_sym_out_constrain)
+    
+    RLL_modulator = RLL_Modulator(encoder_dict, encoder_definite)
+    disk_read_channel = Disk_Read_Channel(params)
+    profiler = Stage_Profiler(params)
+
+    impairments = params.impairments or [default_impairment(params)]
+    equalizer_coeffs = {impairment: load_equalizer_coeffs(params, impairment) for impairment in impairments}
+    # the FIR stage of every impairment equalizes, only the detector is used
+    viterbi_detector, _ = prml_detector(params, equalizer_coeffs[impairments[0]])
+    
+    num_ber = int((params.snr_stop-params.snr_start)/params.snr_step+1)
+    codeword_len = int(params.eval_info_len/rate_constrain)
+    snr_list = params.snr_start + np.arange(0, num_ber)*params.snr_step
+    
+    for impairment in impairments:
+        jitteron, disturbance = impairment
+        ber_list = []
+        for snr in snr_list:
+            # the viterbi metric is carried from block to block as in vit_dec_record
+            metric = [viterbi_detector.ini_metric]
+            def decode_blocks(blocks):
+                dec = np.zeros((blocks.shape[0], params.eval_length))
+                for i, block in enumerate(blocks):
+                    dec[i:i+1], metric[0] = viterbi_detector.vit_dec(block.reshape(1, -1), metric[0])
+                return dec
+            decode_blocks = profiler.wrap("viterbi", decode_blocks)
+            
+            if params.stream_workers:
+                # concurrent stages draw from random states of their own, in a fixed order
+                source_rng, jitter_rng, noise_rng = [np.random.RandomState(seed) for seed in np.random.randint(2**31, size=3)]
+            else:
+                source_rng = jitter_rng = noise_rng = np.random
+            
+            codeword_tee = Tee()
+            stages = [
+                RLL_Stage(RLL_modulator),
+                NRZI_Stage(),
+                codeword_tee,
+                RF_Channel_Stage(params, disk_read_channel, jitteron, jitter_rng),
+                AWGN_Stage(params, snr, noise_rng),
+                Sine_Stage(disk_read_channel, disturbance),
+                FIR_Stage(equalizer_coeffs[impairment]),
+                Block_Detector_Stage(params, decode_blocks)
+            ]
+            for stage in stages:
+                stage.process = profiler.wrap(type(stage).__name__, stage.process)
+                stage.flush = profiler.wrap(type(stage).__name__, stage.flush)
+            source = info_source(params.eval_info_len + dummy_len, params.stream_chunk_bits, rng=source_rng)
+            if params.stream_workers:
+                decisions = concurrent_chain(source, stages, params.stream_workers, params.stream_queue_size)
+            else:
+                decisions = chain(source, *stages)
+            ber = BER_Counter(codeword_tee, codeword_len).consume(decisions)
+            
+            print(f"The impairment (jitteron, disturbance) is: {impairment}")
+            print("The SNR is:")
+            print(snr)
+            print("The bit error rate (BER) is:")
+            print(ber)
+            ber_list.append(ber)
+            profiler.point(impairment=str(impairment), snr=snr)
+        
+        ber_file = ber_result_file(impairment)
         with open(ber_file, "w") as file:
             for ber in ber_list:
                 file.write(f"{ber}\n")
         print(f"ber data have save to {ber_file}")
+    profiler.save()
 
 ## Detector: Viterbi detector
 class Viterbi(object):
@@ -254,88 +286,138 @@ class Viterbi(object):
         self.channel_dict = channel_dict
         self.ini_metric = ini_metric
         self.num_state = self.channel_dict['num_state']
+        
+        # transitions as (from state, to state, input bit, output level)
+        self.trans_from = self.channel_dict['state_machine'][:, 0]
+        self.trans_in = self.channel_dict['in_out'][:, 0]
+        self.trans_out = self.channel_dict['in_out'][:, 1].astype(np.float64)
+        num_trans = self.trans_from.shape[0]
+        
+        # incoming transitions of every state in table order, padded with the
+        # index num_trans whose branch metric is always inf
+        set_in = [np.where(self.channel_dict['state_machine'][:, 1]==state)[0] for state in range(self.num_state)]
+        self.state_in = np.full((self.num_state, max(len(s) for s in set_in)), num_trans)
+        for state in range(self.num_state):
+            self.state_in[state, :len(set_in[state])] = set_in[state]
     
-    def vit_dec(self, r_truncation, ini_metric):
+    def vit_dec(self, r_truncation, ini_metric, return_gap=False):
+        '''
+        Input: (batch, length) array, (num_state, batch) initial metrics
+        Output: (batch, eval_length) decoded word, (num_state, batch) metrics after eval_length,
+        with return_gap also the (batch, eval_length) metric gaps along the survivor path
+        Mapping: Viterbi detector for a truncation part of every row at once; the gap
+        of a sample is how much worse the best competing path into the survivor's
+        state was, a small gap marks an unreliable decision
+        '''
+        batch_size, r_len = r_truncation.shape
+        state_idx = np.arange(self.num_state)
+        num_trans = self.trans_from.shape[0]
         
-        r_len = r_truncation.shape[1]
-        ini_metric_trun = ini_metric
-        path_survivor = np.zeros((self.num_state, r_len))
-        state_metric_trun = np.zeros((self.num_state, self.params.eval_length))
+        state_metric = np.asarray(ini_metric, dtype=np.float64).T
+        trans_survivor = np.zeros((batch_size, self.num_state, r_len), dtype=np.int64)
+        branch_metric = np.full((batch_size, num_trans + 1), np.inf)
+        if return_gap:
+            metric_gap = np.full((batch_size, self.num_state, r_len), np.inf)
         
         for idx in range(r_len):
-            state_path, state_metric = self.metric(r_truncation[:, idx], 
-                                                   ini_metric_trun)
-            
-            ini_metric_trun = state_metric
-            path_survivor[:, idx:idx+1] = state_path
-            if idx == self.params.eval_length-1:
-                state_metric_next = state_metric
+            branch_metric[:, :num_trans] = (state_metric[:, self.trans_from] + 
+                                            (r_truncation[:, idx:idx+1] - self.trans_out) ** 2)
+            metric_in = branch_metric[:, self.state_in]
+            # if we find equal minimum branch metric, we choose the upper path
+            best = np.argmin(metric_in, axis=2)
+            state_metric = np.take_along_axis(metric_in, best[:, :, None], axis=2)[:, :, 0]
+            trans_survivor[:, :, idx] = self.state_in[state_idx, best]
+            if return_gap and self.state_in.shape[1] > 1:
+                metric_gap[:, :, idx] = np.partition(metric_in, 1, axis=2)[:, :, 1] - state_metric
+            if idx == min(self.params.eval_length, r_len)-1:
+                state_metric_next = state_metric.T.copy()
         
-        state_min = np.argmin(state_metric, axis=0)[0]
-        path = self.path_convert(path_survivor)
-        dec_word = self.path_to_word(path, state_min)
+        dec_word, path_gap = self.traceback(trans_survivor, np.argmin(state_metric, axis=1),
+                                            metric_gap if return_gap else None)
         
+        if return_gap:
+            return dec_word[:, :self.params.eval_length], state_metric_next, path_gap[:, :self.params.eval_length]
         return dec_word[:, :self.params.eval_length], state_metric_next
-        
-    def metric(self, r, metric_last):
+    
+    def vit_dec_record(self, r, return_gap=False):
         '''
-        Input: branch metrics at one time step
-        Output: branch metric and survivor metric for the next step 
-        Mapping: choose the shorest path between adjacent states
+        Input: (batch, length) array
+        Output: (batch, length) array, with return_gap also the (batch, length) metric gaps
+        Mapping: Viterbi detector over blocks of eval_length + overlap_length,
+        keeping the decisions of the first eval_length samples of each block
         '''
+        length = r.shape[1]
+        ini_metric = np.repeat(self.ini_metric, r.shape[0], axis=1)
+        detectword = np.zeros(r.shape)
+        gap = np.full(r.shape, np.inf)
+        for pos in range(0, length - self.params.overlap_length, self.params.eval_length):
+            
+            detector_input = r[:, pos:pos+self.params.eval_length+self.params.overlap_length]
+            
+            if return_gap:
+                dec_tmp, metric_next, gap[:, pos:pos+self.params.eval_length] = self.vit_dec(detector_input, ini_metric, True)
+            else:
+                dec_tmp, metric_next = self.vit_dec(detector_input, ini_metric)
+            ini_metric = metric_next
+            detectword[:, pos:pos+self.params.eval_length] = dec_tmp
         
-        path_survivor, metric_survivor = (np.zeros((self.num_state, 1)), 
-                                          np.zeros((self.num_state, 1)))
-        
-        for state in range(self.num_state):
-            set_in = np.where(self.channel_dict['state_machine'][:, 1]==state)[0]
-            metric_tmp = np.zeros((set_in.shape[0], 1))
-            for i in range(set_in.shape[0]):
-                metric_tmp[i, :] = (metric_last[self.channel_dict['state_machine'][set_in[i], 0], :][0] + 
-                                    self.euclidean_distance(r, self.channel_dict['in_out'][set_in[i], 1]))
-            metric_survivor[state, :] = metric_tmp.min()
-            # if we find equal minimum branch metric, we choose the upper path
-            path_survivor[state, :] = (
-                self.channel_dict['state_machine'][set_in[np.where(metric_tmp==metric_tmp.min())[0][0]], 0])
-        return path_survivor, metric_survivor
-                
+        if return_gap:
+            return detectword, gap
+        return detectword
     
-    def path_convert(self, path_survivor):
+    def vit_dec_blocks(self, r, rows, starts):
         '''
-        Input: (num_state, length) array
-        Output: (num_state, length) array
-        Mapping: Viterbi detector for a truncation part
+        Input: (batch, length) array, row and start sample of every block to decode
+        Output: (num_block, eval_length) array
+        Mapping: the blocks of vit_dec_record at these starts, each started
+        overlap_length samples early with all states equally likely instead of
+        the metrics carried from the previous block
         '''
+        params = self.params
+        warm_up = params.overlap_length
+        segment_length = warm_up + params.eval_length + params.overlap_length
+        r_pad = np.zeros((r.shape[0], warm_up + r.shape[1] + params.eval_length + params.overlap_length))
+        r_pad[:, warm_up:warm_up + r.shape[1]] = r
         
-        path_truncation = np.zeros(path_survivor.shape)
-        path_truncation[:, -1:] = path_survivor[:, -1:]
-        for state in range(self.num_state):
-            for i in range(path_survivor.shape[1]-2, -1, -1):
-                path_truncation[state, i] = int(path_survivor[
-                    int(path_truncation[state, i+1]), i])
+        segments = r_pad[np.asarray(rows)[:, None], np.asarray(starts)[:, None] + np.arange(segment_length)]
+        ini_metric = np.zeros((self.num_state, len(segments)))
+        # the first block of a record starts in the known initial state, the
+        # zeros in front of the record keep the trellis in it
+        ini_metric[:, np.asarray(starts) == 0] = self.ini_metric
         
-        return path_truncation
+        # decisions of the first warm_up + eval_length samples, the kept ones follow the warm-up
+        params_warm_up = copy.copy(params)
+        params_warm_up.eval_length = warm_up + params.eval_length
+        viterbi_warm_up = Viterbi(params_warm_up, self.channel_dict, self.ini_metric)
+        dec, _ = viterbi_warm_up.vit_dec(segments, ini_metric)
+        return dec[:, warm_up:]
     
-    def path_to_word(self, path, state):
+    def traceback(self, trans_survivor, state, metric_gap=None):
         '''
-        Input: (1, length) array
-        Output: (1, length) array
-        Mapping: connection between two states determines one word
+        Input: (batch, num_state, length) survivor transitions, (batch,) final states,
+        (batch, num_state, length) metric gaps or None
+        Output: (batch, length) array, (batch, length) metric gaps along the path or None
+        Mapping: follow the survivor transitions back, each one determines one word
         '''
-        
-        length = path.shape[1]
-        word = np.zeros((1, length))
-        for i in range(length-1):
-            idx = find_index(self.channel_dict['state_machine'], path[state, i : i+2])
-            word[:, i] = self.channel_dict['in_out'][idx, 0]
-        
-        idx = find_index(self.channel_dict['state_machine'], np.array([path[state, -1], state]))
-        word[:, -1] = self.channel_dict['in_out'][idx, 0]
-        return word
-    
-    def euclidean_distance(self, x, y):
-        return np.sum((x - y) ** 2)
+        batch_idx = np.arange(trans_survivor.shape[0])
+        length = trans_survivor.shape[2]
+        word = np.zeros((trans_survivor.shape[0], length))
+        path_gap = None if metric_gap is None else np.zeros((trans_survivor.shape[0], length))
+        for i in range(length-1, -1, -1):
+            trans = trans_survivor[batch_idx, state, i]
+            word[:, i] = self.trans_in[trans]
+            if metric_gap is not None:
+                path_gap[:, i] = metric_gap[batch_idx, state, i]
+            state = self.trans_from[trans]
+        return word, path_gap
 
 if __name__ == '__main__':
+    np.set_printoptions(threshold=sys.maxsize)
+    np.random.seed(12345)
     params = Params()
-    realistic_sys(params)
\ No newline at end of file
+    if params.tuned_profile_file:
+        params.apply_tuned_profile(params.tuned_profile_file, "prml")
+    if params.stream_chunk_bits:
+        profile_run(params, streaming_sys, params)
+    else:
+        profile_run(params, realistic_sys, params)
\ No newline at end of file
@@ -1,23 +1,20 @@
 import sys
 import os
 import numpy as np
-sys.path.append(
-    os.path.dirname(
-        os.path.abspath(__file__)))
-from Const import RLL_state_machine
-from Channel_Modulator import RLL_Modulator
-from Channel_Converter import NRZI_Converter
-from Disk_Read_Channel import Disk_Read_Channel
-from Target_PR_Channel import Target_PR_Channel
-from Utils import plot_separated, plot_eye_diagram
-from Params import Params
-sys.path.pop()
+if __name__ == '__main__':
+    # run as a script, make the lib package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.Const import RLL_state_machine
+from lib.Channel_Modulator import RLL_Modulator
+from lib.Channel_Converter import NRZI_Converter
+from lib.Disk_Read_Channel import Disk_Read_Channel
+from lib.Target_PR_Channel import Target_PR_Channel
+from lib.Params import Params
 
-np.random.seed(12345)
 
 class Adaptive_Equalizer(object):
     
-    def __init__(self, equalizer_input, reference_signal, taps_num, mu):
+    def __init__(self, params:Params, equalizer_input, reference_signal, taps_num, mu):
         self.equalizer_input = equalizer_input
         self.reference_signal = reference_signal
         self.taps_num = taps_num
@@ -25,8 +22,9 @@ class Adaptive_Equalizer(object):
         self.mu = mu
         self.len_padding = taps_num - 1
         
-        print('\nLen Padding in adaptive equalizer training is')
-        print(self.len_padding)
+        if params.verbose:
+            print('\nLen Padding in adaptive equalizer training is')
+            print(self.len_padding)
         
     def lms(self):   
         equalizer_output = np.zeros(self.equalizer_input.shape)
@@ -48,15 +46,20 @@ class Adaptive_Equalizer(object):
     def equalized_signal(self):
         equalizer_output = np.zeros(self.equalizer_input.shape)
         
-        equalizer_output = (np.convolve(self.equalizer_coeffs[0,:], self.equalizer_input[0, :])
-               [:-self.len_padding].reshape(self.equalizer_input.shape))
+        # every row is an independent record, e.g. one per snr
+        for row in range(self.equalizer_input.shape[0]):
+            equalizer_output[row, :] = (np.convolve(self.equalizer_coeffs[0,:], self.equalizer_input[row, :])
+                   [:-self.len_padding])
             
         return equalizer_output
 
 if __name__ == '__main__':  
+    from lib.Plot_Utils import plot_separated, plot_eye_diagram
+    np.random.seed(12345)
 
     # constant and input paras
     params = Params()
+    params.verbose = True
     encoder_dict, encoder_definite = RLL_state_machine()
     
     # rate for constrained code
@@ -91,6 +94,7 @@ if __name__ == '__main__':
     signal_upsample_ideal, signal_upsample_jittered, pr_signal_ideal, pr_signal_real = target_pr_channel.target_channel_jitter(codeword)
     
     pr_adaptive_equalizer = Adaptive_Equalizer(        
+        params = params,
         equalizer_input  = equalizer_input,
         reference_signal = pr_signal_ideal,
         taps_num = 15,
@@ -1,13 +1,12 @@
 import sys
 import os
 import numpy as np
-sys.path.append(
-    os.path.dirname(
-        os.path.abspath(__file__)))
-from Const import RLL_state_machine
-from Channel_Modulator import RLL_Modulator
-from Params import Params
-sys.path.pop()
+if __name__ == '__main__':
+    # run as a script, make the lib package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.Const import RLL_state_machine
+from lib.Channel_Modulator import RLL_Modulator
+from lib.Params import Params
 
 class NRZI_Converter(object):
     
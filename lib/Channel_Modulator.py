@@ -1,13 +1,12 @@
 import sys
 import os
 import numpy as np
-sys.path.append(
-    os.path.dirname(
-        os.path.abspath(__file__)))
-from Utils import find_index
-from Const import RLL_state_machine
-from Params import Params
-sys.path.pop()
+if __name__ == '__main__':
+    # run as a script, make the lib package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.Utils import find_index
+from lib.Const import RLL_state_machine
+from lib.Params import Params
 
 ## RLL_Modulator: constrained RLL(1,7) encoder
 class RLL_Modulator(object):
@@ -41,6 +40,9 @@ class RLL_Modulator(object):
             state = self.encoder_dict[state]['next_state'][idx_in, 0]
             codeword[:, self.num_out_sym*idx : self.num_out_sym*(idx+1)] = output_sym
         
+        # state after the last input, to continue the coding of a stream
+        self.end_state = state
+        
         return codeword.astype(int)
     
     def inverse_coding(self, info):
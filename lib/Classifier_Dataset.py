@@ -1,21 +1,20 @@
 import os
+import json
+import multiprocessing
 import numpy as np
 import sys
 import torch
-from torch.utils.data import Dataset
-np.set_printoptions(threshold=sys.maxsize)
-
-sys.path.append(
-    os.path.dirname(
-        os.path.dirname(
-            os.path.abspath(__file__))))
+import torch.nn.functional as F
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
+if __name__ == '__main__':
+    # run as a script, make the lib package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from lib.Const import RLL_state_machine, Target_channel_state_machine
 from lib.Utils import sliding_shape
 from lib.Channel_Modulator import RLL_Modulator
 from lib.Channel_Converter import NRZI_Converter
 from lib.Disk_Read_Channel import Disk_Read_Channel
 from lib.Params import Params
-sys.path.pop()
 
 class PthDataset(Dataset):
     def __init__(self, file_path):
@@ -28,7 +27,195 @@ class PthDataset(Dataset):
 
     def __getitem__(self, idx):
         return self.data[idx, :, :], self.label[idx, :]
+
+## ShardWriter: write a dataset as .npy shards plus a json index
+class ShardWriter(object):
+    '''
+    Every shard is written under a temporary name and renamed once complete,
+    and the index is rewritten after each shard, so an interrupted build
+    keeps all finished shards and can resume from the missing ones.
+    '''
+    def __init__(self, data_dir, layout=None):
+        self.data_dir = data_dir
+        self.index_path = os.path.join(data_dir, 'index.json')
+        
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+        
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, 'r') as file:
+                self.index = json.load(file)
+            if layout is not None and self.index.get('layout') != layout:
+                raise ValueError(f"{data_dir} holds shards of layout {self.index.get('layout')}, expected {layout}")
+        else:
+            self.index = {'layout': layout, 'shards': []}
+    
+    def has_shard(self, shard_id):
+        return any(shard['id'] == shard_id for shard in self.index['shards'])
+    
+    def save_shard(self, shard_id, data, label, energy=None):
+        '''
+        write the shard files only, the index is left untouched
+        output: index entry of the shard
+        '''
+        shard = {
+            'id': int(shard_id),
+            'data': f"data_{shard_id:05d}.npy",
+            'label': f"label_{shard_id:05d}.npy",
+            'num_samples': int(data.shape[0])
+        }
+        arrays = [(shard['data'], data), (shard['label'], label)]
+        if energy is not None:
+            shard['energy'] = f"energy_{shard_id:05d}.npy"
+            arrays.append((shard['energy'], energy))
+        for name, array in arrays:
+            file_path = os.path.join(self.data_dir, name)
+            with open(file_path + '.tmp', 'wb') as file:
+                np.save(file, array)
+            os.replace(file_path + '.tmp', file_path)
+        return shard
+    
+    def commit(self, shard):
+        self.index['shards'] = [s for s in self.index['shards'] if s['id'] != shard['id']]
+        self.index['shards'].append(shard)
+        self.index['shards'].sort(key=lambda s: s['id'])
+        with open(self.index_path + '.tmp', 'w') as file:
+            json.dump(self.index, file, indent=2)
+        os.replace(self.index_path + '.tmp', self.index_path)
+    
+    def write_shard(self, shard_id, data, label, energy=None):
+        self.commit(self.save_shard(shard_id, data, label, energy))
+
+## ShardDataset: memory-mapped dataset written by ShardWriter
+class ShardDataset(Dataset):
+    '''
+    Shards hold raw blocks (block_length,) in a compact dtype and uint8 or
+    bit-packed labels; the (block_length, input_size) windows are only built
+    in __getitem__. Shards written without a layout hold ready windows.
+    Clean shards hold noiseless blocks and the record energy instead: items
+    are (block, label, energy) and NoiseCollate adds the noise per batch.
+    window=False gives the (block_length,) raw blocks, for models built with params.raw_input.
+    '''
+    def __init__(self, data_dir, window=True):
+        self.data_dir = data_dir
+        self.window = window
+        with open(os.path.join(data_dir, 'index.json'), 'r') as file:
+            index = json.load(file)
+        self.shards = index['shards']
+        self.layout = index.get('layout') or {}
+        
+        num_samples = np.array([shard['num_samples'] for shard in self.shards], dtype=np.int64)
+        self.shard_end = np.cumsum(num_samples)
+        self.shard_start = self.shard_end - num_samples
+        
+        # shards are opened lazily so that all DataLoader workers share the page cache
+        self.data, self.label, self.energy = None, None, None
     
+    def open_shards(self):
+        self.data = [np.load(os.path.join(self.data_dir, shard['data']), mmap_mode='r') 
+                     for shard in self.shards]
+        self.label = [np.load(os.path.join(self.data_dir, shard['label']), mmap_mode='r') 
+                      for shard in self.shards]
+        if self.layout.get('clean'):
+            self.energy = [np.load(os.path.join(self.data_dir, shard['energy']), mmap_mode='r') 
+                           for shard in self.shards]
+    
+    def to_window(self, data, label):
+        '''
+        Input: (batch, block_length) stored data and label
+        Output: (batch, block_length, input_size) float32 data, (batch, block_length) float32 label;
+        (batch, block_length) data without window
+        '''
+        if self.layout.get('block_length') is None:
+            if not self.window:
+                # the last entry of every stored window is its own sample
+                data = data[:, :, -1]
+            return np.array(data, dtype=np.float32), np.array(label, dtype=np.float32)
+        
+        if self.window:
+            data = sliding_shape(data, self.layout['input_size'], contiguous=True)
+        else:
+            data = np.array(data, dtype=np.float32)
+        if self.layout['label_packed']:
+            label = np.unpackbits(label, axis=-1, count=self.layout['block_length'])
+        return data, label.astype(np.float32)
+    
+    def arrays(self):
+        '''
+        whole dataset for the non-nn models
+        output: numpy array data, numpy array label
+        '''
+        if self.data is None:
+            self.open_shards()
+        data, label = np.concatenate(self.data, axis=0), np.concatenate(self.label, axis=0)
+        if self.layout.get('clean'):
+            # one noise draw at a uniform snr per block, as NoiseCollate does per batch
+            energy = np.concatenate(self.energy, axis=0)
+            snr = np.random.uniform(self.layout['snr_start'], self.layout['snr_stop'], size=energy.shape)
+            sigma = np.sqrt(0.5 * energy * 10 ** (- snr * 1.0 / 10))
+            data = data + sigma[:, None] * np.random.normal(0, 1, data.shape)
+        return self.to_window(data, label)
+
+    def __len__(self):
+        return int(self.shard_end[-1]) if len(self.shards) else 0
+
+    def __getitem__(self, idx):
+        if self.data is None:
+            self.open_shards()
+        shard_idx = int(np.searchsorted(self.shard_end, idx, side='right'))
+        pos = idx - self.shard_start[shard_idx]
+        if self.layout.get('clean'):
+            data = torch.from_numpy(np.array(self.data[shard_idx][pos], dtype=np.float32))
+            label = np.array(self.label[shard_idx][pos:pos+1])
+            if self.layout['label_packed']:
+                label = np.unpackbits(label, axis=-1, count=self.layout['block_length'])
+            label = torch.from_numpy(label[0].astype(np.float32))
+            return data, label, torch.tensor(float(self.energy[shard_idx][pos]))
+        data, label = self.to_window(self.data[shard_idx][pos:pos+1], self.label[shard_idx][pos:pos+1])
+        return torch.from_numpy(data[0]), torch.from_numpy(label[0])
+    
+## NoiseCollate: add awgn to a batch of clean blocks and build the sliding windows
+class NoiseCollate(object):
+    '''
+    Input: list of (block, label, energy) items from a clean ShardDataset
+    Output: (batch, block_length, input_size) noisy windows, (batch, block_length) labels;
+    (batch, block_length) noisy blocks without window
+    Mapping: awgn as Disk_Read_Channel.awgn, at an snr drawn uniformly in
+    [snr_start, snr_stop] for every block, so each epoch sees fresh noise;
+    with a seed the noise is drawn from a generator that reset() rewinds,
+    so an unshuffled loader sees the same noise in every epoch
+    '''
+    def __init__(self, layout, window=True, seed=None):
+        self.window = window
+        self.input_size = layout['input_size']
+        self.snr_start = layout['snr_start']
+        self.snr_stop = layout['snr_stop']
+        self.seed = seed
+        self.generator = None
+    
+    def reset(self):
+        '''
+        rewind the generator before iterating the loader, its workers copy the rewound one
+        '''
+        self.generator = None
+    
+    def __call__(self, batch):
+        data = torch.stack([item[0] for item in batch])
+        label = torch.stack([item[1] for item in batch])
+        energy = torch.stack([item[2] for item in batch])
+        
+        if self.seed is not None and self.generator is None:
+            # every worker collates its own fixed share of the batches
+            worker = get_worker_info()
+            self.generator = torch.Generator().manual_seed(self.seed + (worker.id if worker else 0))
+        snr = torch.empty_like(energy).uniform_(self.snr_start, self.snr_stop, generator=self.generator)
+        sigma = torch.sqrt(0.5 * energy * 10 ** (- snr / 10))
+        data = data + sigma[:, None] * torch.randn(data.shape, dtype=data.dtype, generator=self.generator)
+        
+        if self.window:
+            data = F.pad(data, (self.input_size - 1, 0)).unfold(1, self.input_size, 1)
+        return data, label
+
 ## Rawdb: generate rawdb for neural network
 class Rawdb(object):
     def __init__(self, params:Params, encoder_dict, encoder_definite, channel_dict):
@@ -48,13 +235,68 @@ class Rawdb(object):
         self.NRZI_converter = NRZI_Converter()
         self.disk_read_channel = Disk_Read_Channel(params)
     
-    def data_generation(self, prob, info_len):
+    def clean_record(self, prob, info_len):
         '''
-        training/testing data(with sliding window) and label
-        output: numpy array 
+        codeword and noiseless rf signal (jittered if params.jitteron) of one record
+        output: numpy array codeword, numpy array rf_signal_input
         '''
         params = self.params
         dummy_len = int(params.overlap_length * self.code_rate)
+        
+        info = np.random.choice(np.arange(0, 2), size = (1, info_len + dummy_len), p=[1-prob, prob])
+        
+        codeword = self.NRZI_converter.forward_coding(self.RLL_modulator.forward_coding(info))
+        signal_upsample_ideal, signal_upsample_jittered, rf_signal_ideal, rf_signal = self.disk_read_channel.RF_signal_jitter(codeword)
+        if params.jitteron:
+            rf_signal_input = rf_signal
+        else:
+            rf_signal_input = rf_signal_ideal
+        
+        return codeword, rf_signal_input
+    
+    def record_block(self, x, info_len):
+        '''
+        Input: (1, length) record
+        Output: (blocks, eval_length + overlap_length) strided view
+        Mapping: blocks starting every eval_length samples
+        '''
+        params = self.params
+        codeword_len = int(info_len/self.code_rate)
+        bt_size_snr = int(codeword_len/params.eval_length)
+        block_length = params.eval_length + params.overlap_length
+        
+        return np.lib.stride_tricks.sliding_window_view(x[0, :], block_length)[::params.eval_length][:bt_size_snr]
+    
+    def record_generation(self, prob, snr, info_len):
+        '''
+        one record at one snr cut into overlapping blocks (without sliding window)
+        output: numpy array data, numpy array label
+        '''
+        codeword, rf_signal_input = self.clean_record(prob, info_len)
+        equalizer_input = self.disk_read_channel.awgn(rf_signal_input, snr)
+        
+        return self.record_block(equalizer_input, info_len), self.record_block(codeword, info_len)
+    
+    def clean_data_generation(self, prob, info_len):
+        '''
+        noiseless training/testing blocks, label and record energy, noise is added while loading
+        output: numpy array data, numpy array label, numpy array energy
+        '''
+        codeword, rf_signal_input = self.clean_record(prob, info_len)
+        data = self.record_block(rf_signal_input, info_len)
+        label = self.record_block(codeword, info_len)
+        energy = np.full(data.shape[0], self.disk_read_channel.signal_energy(rf_signal_input), dtype=np.float32)
+        
+        print("generate clean training/testing data and label")
+        
+        return data, label, energy
+    
+    def data_generation(self, prob, info_len, window=True):
+        '''
+        training/testing data(with sliding window unless window=False) and label
+        output: numpy array 
+        '''
+        params = self.params
         codeword_len = int(info_len/self.code_rate)
         num_ber = int((params.snr_stop-params.snr_start)/params.snr_step+1)
         
@@ -67,151 +309,197 @@ class Rawdb(object):
         for snr_idx in np.arange(0, num_ber):
             snr = params.snr_start+snr_idx*params.snr_step
             
-            info = np.random.choice(np.arange(0, 2), size = (1, info_len + dummy_len), p=[1-prob, prob])
-            
-            codeword = self.NRZI_converter.forward_coding(self.RLL_modulator.forward_coding(info))
-            signal_upsample_ideal, signal_upsample_jittered, rf_signal_ideal, rf_signal = self.disk_read_channel.RF_signal_jitter(codeword)
-            if params.only_awgn:
-                rf_signal_input = rf_signal_ideal
-            else:
-                rf_signal_input = rf_signal
-            equalizer_input = self.disk_read_channel.awgn(rf_signal_input, snr)
-            
-            length = equalizer_input.shape[1]
-            for signal_idx, pos in enumerate(range(0, length - params.overlap_length, params.eval_length)):
-                
-                codeword_truncation = codeword[:, pos:pos+params.eval_length+params.overlap_length]
-                rf_signal_truncation = rf_signal[:, pos:pos+params.eval_length+params.overlap_length]
-                equalizer_input_truncation = equalizer_input[:, pos:pos+params.eval_length+params.overlap_length]
-                
-                label[snr_idx*bt_size_snr + signal_idx:snr_idx*bt_size_snr + signal_idx + 1, :] = codeword_truncation
-                data[snr_idx*bt_size_snr + signal_idx:snr_idx*bt_size_snr + signal_idx + 1, :]  = equalizer_input_truncation
-        
-        data = sliding_shape(data, params.input_size)
-        label = label
+            data_snr, label_snr = self.record_generation(prob, snr, info_len)
+            data[snr_idx*bt_size_snr:(snr_idx+1)*bt_size_snr, :] = data_snr
+            label[snr_idx*bt_size_snr:(snr_idx+1)*bt_size_snr, :] = label_snr
+        
+        if window:
+            data = sliding_shape(data, params.input_size)
         
         print("generate training/testing data(with sliding window) and label")
         
         return data, label
     
-    def data_generation_eval(self, prob, snr):
+    def data_generation_eval(self, prob, snr, window=True):
         '''
-        evaluation data (with sliding window) and label
+        evaluation data (with sliding window unless window=False) and label
         output: numpy array data_eval, numpy array label_eval
         '''
         params = self.params
-        info_len = params.data_val_len
-        dummy_len = int(params.overlap_length * self.code_rate)
-        codeword_len = int(info_len/self.code_rate)
-        num_ber = 1
-        
-        bt_size_snr = int(codeword_len/params.eval_length)
-        bt_size = num_ber*bt_size_snr
-        block_length = params.eval_length + params.overlap_length
-        data, label = (np.zeros((bt_size, block_length)), np.zeros((bt_size, block_length)))
+        data, label = self.record_generation(prob, snr, params.data_val_len)
         
-        # generate data and label from stream data
-        info = np.random.choice(np.arange(0, 2), size = (1, info_len + dummy_len), p=[1-prob, prob])
-        
-        codeword = self.NRZI_converter.forward_coding(self.RLL_modulator.forward_coding(info))
-        signal_upsample_ideal, signal_upsample_jittered, rf_signal_ideal, rf_signal = self.disk_read_channel.RF_signal_jitter(codeword)
-        if params.only_awgn:
-            rf_signal_input = rf_signal_ideal
-        else:
-            rf_signal_input = rf_signal
-        equalizer_input = self.disk_read_channel.awgn(rf_signal_input, snr)
-        
-        length = equalizer_input.shape[1]
-        for signal_idx, pos in enumerate(range(0, length - params.overlap_length, params.eval_length)):
-            
-            codeword_truncation = codeword[:, pos:pos+params.eval_length+params.overlap_length]
-            rf_signal_truncation = rf_signal[:, pos:pos+params.eval_length+params.overlap_length]
-            equalizer_input_truncation = equalizer_input[:, pos:pos+params.eval_length+params.overlap_length]
-            
-            label[signal_idx:signal_idx + 1, :] = codeword_truncation
-            data[signal_idx:signal_idx + 1, :]  = equalizer_input_truncation
-        
-        data = sliding_shape(data, params.input_size)
-        label = label
+        if window:
+            data = sliding_shape(data, params.input_size)
         
         print("generate evaluation data (with sliding window) and label")
         
         return data, label
     
-    def build_rawdb(self, data_dir):
-
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
+    def random_prob(self):
+        miu = (0.1 + 0.9)/2
+        sigma = (0.9 - miu)/2
+        random_p = np.random.normal(miu, sigma)
+        return min(max(random_p, 0), 1)
+    
+    def random_snr(self):
+        params = self.params
+        miu = (params.snr_start + params.snr_stop)/2
+        sigma = (params.snr_stop - miu)/2
+        random_snr = np.random.normal(miu, sigma)
+        return min(max(random_snr, params.snr_start), params.snr_stop)
+    
+    def generate_batch(self, set_name):
+        '''
+        one batch of a set as raw blocks, the sliding window is left to the loader;
+        with params.dataset_clean_signal the train/test batches are a single
+        noiseless record plus its energy instead of one noisy record per snr
+        output: numpy array data, numpy array label, numpy array energy or None
+        '''
+        params = self.params
+        if set_name == 'validate':
+            random_p = self.random_prob()
+            return self.data_generation_eval(random_p, self.random_snr(), window=False) + (None,)
         
+        info_len = params.data_train_len if set_name == 'train' else params.data_test_len
+        if params.dataset_clean_signal:
+            return self.clean_data_generation(self.random_prob(), info_len)
+        return self.data_generation(self.random_prob(), info_len, window=False) + (None,)
+    
+    def shard_layout(self, set_name):
+        params = self.params
+        layout = {
+            'block_length': params.eval_length + params.overlap_length,
+            'input_size': params.input_size,
+            'signal_dtype': params.dataset_signal_dtype,
+            'label_packed': params.dataset_pack_labels
+        }
+        if params.dataset_clean_signal and set_name != 'validate':
+            layout.update({'clean': True, 'snr_start': params.snr_start, 'snr_stop': params.snr_stop})
+        return layout
+    
+    def generate_shard(self, set_name, num_batches):
+        '''
+        num_batches batches of one set copied into a preallocated shard,
+        signals are stored in params.dataset_signal_dtype and labels as uint8,
+        bit-packed along the block if params.dataset_pack_labels
+        output: numpy array data, numpy array label, numpy array energy or None
+        '''
+        params = self.params
+        data, label, energy = None, None, None
+        for bt in range(num_batches):
+            data_bt, label_bt, energy_bt = self.generate_batch(set_name)
+            label_bt = label_bt.astype(np.uint8)
+            if params.dataset_pack_labels:
+                label_bt = np.packbits(label_bt, axis=1)
+            bt_size = data_bt.shape[0]
+            if data is None:
+                data = np.empty((num_batches*bt_size,) + data_bt.shape[1:], dtype=params.dataset_signal_dtype)
+                label = np.empty((num_batches*bt_size,) + label_bt.shape[1:], dtype=np.uint8)
+                if energy_bt is not None:
+                    energy = np.empty(num_batches*bt_size, dtype=np.float32)
+            data[bt*bt_size:(bt+1)*bt_size] = data_bt
+            label[bt*bt_size:(bt+1)*bt_size] = label_bt
+            if energy is not None:
+                energy[bt*bt_size:(bt+1)*bt_size] = energy_bt
+        return data, label, energy
+    
+    def build_rawdb(self, data_dir):
+        '''
+        write the train/test/validate sets as shards of params.shard_batches batches,
+        shards already present in a set index are kept and not generated again;
+        shards are generated by a pool of params.dataset_workers processes
+        '''
         params =  self.params
-        block_length = params.eval_length + params.overlap_length
+        set_batches = {
+            'train': params.train_set_batches,
+            'test': params.test_set_batches,
+            'validate': params.validate_set_batches
+        }
+        
+        writers, tasks = {}, []
+        for set_idx, (set_name, num_batches) in enumerate(set_batches.items()):
+            set_dir = f"{data_dir}/classifier_{set_name}_set"
+            writers[set_name] = ShardWriter(set_dir, self.shard_layout(set_name))
+            num_shards = -(-num_batches // params.shard_batches)
+            for shard_id in range(num_shards):
+                if writers[set_name].has_shard(shard_id):
+                    continue
+                shard_batches = min(params.shard_batches, num_batches - shard_id*params.shard_batches)
+                # one independent stream per shard, whatever the number of workers
+                seed = np.random.SeedSequence(params.dataset_seed, spawn_key=(set_idx, shard_id))
+                tasks.append((set_name, set_dir, shard_id, shard_batches, seed.generate_state(1)[0]))
+        
+        num_workers = params.dataset_workers or os.cpu_count()
+        if num_workers > 1 and len(tasks) > 1:
+            with multiprocessing.Pool(min(num_workers, len(tasks)), initializer=init_shard_worker, initargs=(self,)) as pool:
+                for set_name, shard in pool.imap_unordered(build_shard_worker, tasks):
+                    writers[set_name].commit(shard)
+                    print(f"generate {set_name} shard {shard['id']}\n")
+        else:
+            init_shard_worker(self)
+            for task in tasks:
+                set_name, shard = build_shard_worker(task)
+                writers[set_name].commit(shard)
+                print(f"generate {set_name} shard {shard['id']}\n")
+        
+        print(f"generate datasets in {data_dir}\n")
+
+## shard workers: each process keeps one Rawdb and reseeds it per shard
+shard_rawdb = None
+
+def init_shard_worker(rawdb:Rawdb):
+    global shard_rawdb
+    shard_rawdb = rawdb
 
-        data = np.empty((0, block_length, params.input_size))
-        label = np.empty((0, block_length))
-        for _ in range(params.train_set_batches):
-
-            miu = (0.1 + 0.9)/2
-            sigma = (0.9 - miu)/2
-            random_p = np.random.normal(miu, sigma)
-            random_p = min(max(random_p, 0), 1)
-
-            data_train, label_train = self.data_generation(random_p, params.data_train_len)
-            data = np.append(data, data_train, axis=0)
-            label = np.append(label, label_train, axis=0)
-
-        file_path = f"{data_dir}/classifier_train_set.pth"
-        torch.save({
-            'data': data,
-            'label': label
-        }, file_path, pickle_protocol=4)
-        print("generate training dataset\n")
-
-        data = np.empty((0, block_length, params.input_size))
-        label = np.empty((0, block_length))
-        for _ in range(params.test_set_batches):
-
-            miu = (0.1 + 0.9)/2
-            sigma = (0.9 - miu)/2
-            random_p = np.random.normal(miu, sigma)
-            random_p = min(max(random_p, 0), 1)
-
-            data_test, label_test = self.data_generation(random_p, params.data_test_len)
-            data = np.append(data, data_test, axis=0)
-            label = np.append(label, label_test, axis=0)
-
-        file_path = f"{data_dir}/classifier_test_set.pth"
-        torch.save({
-            'data': data,
-            'label': label
-        }, file_path, pickle_protocol=4)
-        print("generate testing dataset\n")
-
-        data = np.empty((0, block_length, params.input_size))
-        label = np.empty((0, block_length))
-        for _ in range(params.validate_set_batches):
-
-            miu = (0.1 + 0.9)/2
-            sigma = (0.9 - miu)/2
-            random_p = np.random.normal(miu, sigma)
-            random_p = min(max(random_p, 0), 1)
-
-            miu = (params.snr_start + params.snr_stop)/2
-            sigma = (params.snr_stop - miu)/2
-            random_snr = np.random.normal(miu, sigma)
-            random_snr = min(max(random_snr, params.snr_start), params.snr_stop)
-
-            data_val, label_val = self.data_generation_eval(random_p, random_snr)
-            data = np.append(data, data_val, axis=0)
-            label = np.append(label, label_val, axis=0)
-
-        file_path = f"{data_dir}/classifier_validate_set.pth"
-        torch.save({
-            'data': data,
-            'label': label
-        }, file_path, pickle_protocol=4)
-        print("generate validate dataset\n")
+def build_shard_worker(task):
+    set_name, set_dir, shard_id, num_batches, seed = task
+    np.random.seed(seed)
+    data, label, energy = shard_rawdb.generate_shard(set_name, num_batches)
+    shard = ShardWriter(set_dir).save_shard(shard_id, data, label, energy)
+    return set_name, shard
+
+## SyntheticDataset: endless (window, label) samples simulated inside each DataLoader worker
+class SyntheticDataset(IterableDataset):
+    '''
+    prob_sampler and snr_sampler are picklable callables returning the bit
+    probability and the snr of the next record, Rawdb.random_prob and
+    Rawdb.random_snr are used by default
+    '''
+    def __init__(self, params:Params, prob_sampler=None, snr_sampler=None):
+        self.params = params
+        self.prob_sampler = prob_sampler
+        self.snr_sampler = snr_sampler
+    
+    def __iter__(self):
+        params = self.params
+        
+        # every worker of every epoch gets its own stream
+        worker_info = get_worker_info()
+        if worker_info is not None:
+            np.random.seed(np.random.SeedSequence([params.dataset_seed, worker_info.seed]).generate_state(1)[0])
+        
+        encoder_dict, encoder_definite = RLL_state_machine()
+        channel_dict = Target_channel_state_machine()
+        if params.signal_norm:
+            channel_dict['in_out'][:, 1] /= sum(params.PR_coefs)
+        rawdb = Rawdb(params, encoder_dict, encoder_definite, channel_dict)
+        prob_sampler = self.prob_sampler or rawdb.random_prob
+        snr_sampler = self.snr_sampler or rawdb.random_snr
+        
+        while True:
+            # shuffle blocks across several records so a batch mixes snrs and probs
+            records = [rawdb.record_generation(prob_sampler(), snr_sampler(), params.data_train_len) 
+                       for _ in range(params.synthetic_records)]
+            data = np.concatenate([record[0] for record in records]).astype(np.float32)
+            if not params.raw_input:
+                data = sliding_shape(data, params.input_size, contiguous=True)
+            label = np.concatenate([record[1] for record in records]).astype(np.float32)
+            
+            for idx in np.random.permutation(data.shape[0]):
+                yield torch.from_numpy(data[idx]), torch.from_numpy(label[idx])
 
 if __name__ == '__main__':
+    np.set_printoptions(threshold=sys.maxsize)
     params = Params()
 
     # constant and input paras
@@ -1,18 +1,15 @@
 import sys
 import os
 import numpy as np
-sys.path.append(
-    os.path.dirname(
-        os.path.abspath(__file__)))
-from Const import RLL_state_machine
-from Channel_Modulator import RLL_Modulator
-from Channel_Converter import NRZI_Converter
-from Disk_Response import BD_symbol_response
-from Utils import plot_separated, plot_eye_diagram
-from Params import Params
-sys.path.pop()
+if __name__ == '__main__':
+    # run as a script, make the lib package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.Const import RLL_state_machine
+from lib.Channel_Modulator import RLL_Modulator
+from lib.Channel_Converter import NRZI_Converter
+from lib.Disk_Response import BD_symbol_response
+from lib.Params import Params
 
-np.random.seed(12345)
     
 class Disk_Read_Channel(object):
     
@@ -23,12 +20,13 @@ class Disk_Read_Channel(object):
         mid_idx = len(bd_di_coef)//2
         self.bd_di_coef = bd_di_coef[mid_idx : mid_idx + upsample_factor*self.params.tap_bd_num].reshape(1,-1)
         
-        print('\nThe dipulse bd coefficient is')
-        print(bd_di_coef)
-        print(f"bd_di_coef.shape: {bd_di_coef.shape}")
-        print('\nTap bd coefficient is')
-        print(self.bd_di_coef)
-        print(f"self.bd_di_coef.shape: {self.bd_di_coef.shape}")
+        if params.verbose:
+            print('\nThe dipulse bd coefficient is')
+            print(bd_di_coef)
+            print(f"bd_di_coef.shape: {bd_di_coef.shape}")
+            print('\nTap bd coefficient is')
+            print(self.bd_di_coef)
+            print(f"self.bd_di_coef.shape: {self.bd_di_coef.shape}")
     
     def RF_signal_jitter(self, codeword):
         params = self.params
@@ -71,20 +69,20 @@ class Disk_Read_Channel(object):
         
         return signal_upsample_ideal, signal_upsample_jittered, rf_signal_ideal, rf_signal
 
-    def addsin(self, x):
+    def addsin(self, x, t0=0):
         amplitude = 0.03
         frequency = 0.001
-        t = np.arange(len(x.reshape(-1)))
+        t = t0 + np.arange(x.shape[-1])
         # 生成正弦波数组
         sine_wave = amplitude * np.sin(2 * np.pi * frequency * t)
         # 加入正弦扰动
         x_noise = x + sine_wave
         return x_noise
 
-    def multiplysin(self, x):
+    def multiplysin(self, x, t0=0):
         amplitude = 0.03
         frequency = 0.001
-        t = np.arange(len(x.reshape(-1)))
+        t = t0 + np.arange(x.shape[-1])
         # 生成正弦波数组
         sine_wave = amplitude * np.sin(2 * np.pi * frequency * t)
         # 加入正弦扰动
@@ -92,16 +90,39 @@ class Disk_Read_Channel(object):
         return x_noise
 
 
+    def signal_energy(self, x):
+        return np.mean(np.square(x[0, :self.params.truncation4energy]))
+
     def awgn(self, x, snr):
-        E_b = np.mean(np.square(x[0, :self.params.truncation4energy]))
+        E_b = self.signal_energy(x)
         sigma = np.sqrt(0.5 * E_b * 10 ** (- snr * 1.0 / 10))
         x_noise = x + sigma * np.random.normal(0, 1, x.shape)
         return x_noise    
+
+    def awgn_sweep(self, x, snrs, shared_noise=True, noise=None):
+        '''
+        Input: (1, length) array, (num_snr,) snrs
+        Output: (num_snr, length) array
+        Mapping: awgn at every snr in one broadcast, scaling one shared
+        standard normal draw or num_snr independent draws; a given
+        (1 or num_snr, length) standard normal noise is used as is
+        '''
+        E_b = self.signal_energy(x)
+        sigma = np.sqrt(0.5 * E_b * 10 ** (- np.asarray(snrs, dtype=np.float64).reshape(-1, 1) * 1.0 / 10))
+        if noise is None and shared_noise:
+            noise = np.random.normal(0, 1, x.shape)
+        elif noise is None:
+            noise = np.random.normal(0, 1, (sigma.shape[0], x.shape[1]))
+        x_noise = x + sigma * noise
+        return x_noise
     
 if __name__ == '__main__':
+    from lib.Plot_Utils import plot_separated, plot_eye_diagram
+    np.random.seed(12345)
     
     # constant and input paras
     params = Params()
+    params.verbose = True
     encoder_dict, encoder_definite = RLL_state_machine()
     RLL_modulator = RLL_Modulator(encoder_dict, encoder_definite)
     NRZI_converter = NRZI_Converter()
@@ -1,12 +1,10 @@
 import sys
 import os
 import numpy as np
-from scipy.special import erf
-sys.path.append(
-    os.path.dirname(
-        os.path.abspath(__file__)))
-from Utils import plot_separated, Fourier_Analysis
-sys.path.pop()
+if __name__ == '__main__':
+    # run as a script, make the lib package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.Utils import Fourier_Analysis
 
 def disk_impulse_response(wavelength, na, T_L, bit_periods, upsample_factor):
     T_0 = 0.86 * wavelength / na
@@ -17,6 +15,7 @@ def disk_impulse_response(wavelength, na, T_L, bit_periods, upsample_factor):
     return t/T_L, impulse_response
 
 def disk_symbol_response(wavelength, na, T_L, bit_periods, upsample_factor):
+    from scipy.special import erf # scipy is only needed once per channel construction
     T_0 = 0.86 * wavelength / na
     t = np.linspace(-bit_periods * T_L, bit_periods * T_L, int(2*upsample_factor*bit_periods + 1))
 
@@ -49,6 +48,7 @@ def HDDVD_symbol_response(bit_periods, upsample_factor = 1):
     return disk_symbol_response(wavelength, na, T_L, bit_periods, upsample_factor)
        
 if __name__ == '__main__':
+    from lib.Plot_Utils import plot_separated
     
     bit_periods = 10
     BD_T_L = 74.5e-9
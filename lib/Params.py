@@ -1,3 +1,4 @@
+import json
 
 class Params:
     """
@@ -10,11 +11,14 @@ class Params:
         # io dir or files
         self.model_dir = "../model/"
         self.result_file = 'result.txt'
+        self.verbose = False # print the channel and equalizer coefficients on construction
         self.equalizer_coeffs_dir = "../data"
         self.equalizer_coeffs_jitter_sine_file = "../data/equalizer_coeffs_jitter_sine.txt"
         self.equalizer_coeffs_jitter_file = "../data/equalizer_coeffs_jitter.txt"
         self.equalizer_coeffs_sine_file = "../data/equalizer_coeffs_sine.txt"
         self.equalizer_coeffs_file = "../data/equalizer_coeffs.txt"
+        self.equalizer_coeffs_jitter_multsine_file = "../data/equalizer_coeffs_jitter_multsine.txt"
+        self.equalizer_coeffs_multsine_file = "../data/equalizer_coeffs_multsine.txt"
         
         # plot params
         self.num_plots = 5
@@ -26,12 +30,80 @@ class Params:
         
         # detector/decoder params
         self.eval_info_len = 1000000
+        self.eval_snr_group_size = 4 # snrs sharing one synthesized record, 1 for a record per snr, None for all at once, memory grows with it
+        self.eval_shared_noise = True # scale one standard normal draw for all snrs of a record
+        self.stream_chunk_bits = None # info bits per chunk of the streaming evaluation, None to synthesize whole records
+        self.stream_workers = None # 'thread' or 'process' worker for every streaming stage, or a list with one per stage; None runs the stages in turn
+        self.stream_queue_size = 4 # chunks waiting between two concurrent streaming stages
+        self.compare_detectors = ["prml", "lr", "xgboost", "mlp", "cnn", "unet", "rnn", "rnn_stream", "transformer"] # first one is the reference
+        self.compare_result_file = "../data/compare_result.csv"
+        self.cascade_first = "prml_short" # cheap detector of every block: "prml_short", "prml" or a model_arch
+        self.cascade_second = "prml" # detector of the escalated blocks: "prml" or a model_arch
+        self.cascade_short_overlap = 6 # overlap_length of prml_short
+        self.cascade_prml_thresholds = [0.0005, 0.001, 0.002] # blocks whose smallest metric gap is below are escalated, when the first stage is prml
+        self.cascade_model_thresholds = [0.02, 0.05, 0.1] # blocks whose smallest |2p - 1| is below are escalated, when the first stage is a model
+        self.cascade_result_file = "../data/cascade_result.csv"
+        
+        # decode server params
+        self.server_detector = "rnn" # "prml" or a nn model_arch
+        self.server_host = "127.0.0.1"
+        self.server_port = 8500
+        self.server_socket = None # path of a unix socket to serve on instead of host:port
+        self.server_latency_ms = 5 # longest wait for more requests to join a batch
+        self.server_batch_samples = 245760 # samples of all requests decoded by one batched call
+        
+        # benchmark params
+        self.benchmark_cases = None # names from scripts/benchmark.py, None for all
+        self.benchmark_lengths = [10000, 100000] # record lengths in bits/samples
+        self.benchmark_batches = [1, 8] # rows decoded together, only for the batched cases
+        self.benchmark_repeats = 3 # timed runs per case, the fastest one is kept
+        self.benchmark_timeout = 600 # seconds a case may run before it is stopped and recorded as failed
+        self.benchmark_result_file = "../data/benchmark_result.json"
+        self.benchmark_baseline_file = "../data/benchmark_baseline.json" # written by the first run
+        self.benchmark_tolerance = 0.2 # relative throughput drop reported as a regression
+
+        # profiling params
+        self.profile = False # time every stage and detector call, one record per stage and snr point
+        self.profile_memory = False # also trace the peak bytes every stage allocates, slows down allocations
+        self.profile_log_file = "../data/profile_log.json" # .json or .csv
+        self.profile_run = None # None, "cprofile" or "tracemalloc" around the whole run
+        self.profile_stats_file = "../data/profile_stats.prof" # cProfile stats, read with pstats
+        self.profile_top = 20 # functions or allocation sites printed after a profiled run
+
+        # pareto benchmark params, the detectors are those of compare_detectors
+        self.pareto_snrs = [8, 10] # reference snrs the ber of every detector is measured at
+        self.pareto_info_len = 100000 # info bits per reference snr
+        self.pareto_length = 20000 # samples per row of the timed decodes
+        self.pareto_batches = [1, 8, 64] # rows decoded together
+        self.pareto_threads = [1, 4] # torch, blas and openmp threads
+        self.pareto_repeats = 3 # timed decodes per setting, the fastest one is kept
+        self.pareto_result_file = "../data/pareto_result.json"
+
+        # auto-tune params, the current settings are the reference
+        self.tune_detector = "rnn" # "prml" or a model_arch
+        self.tune_snr = 10 # snr the ber of every candidate is measured at
+        self.tune_info_len = 100000 # info bits of the ber measurement
+        self.tune_ber_tolerance = 0.05 # relative ber increase over the reference setting a candidate may have
+        self.tune_block_lengths = [(30, 30), (60, 30), (60, 60), (120, 60), (240, 60)] # (eval_length, overlap_length)
+        self.tune_decode_batch_sizes = [256, 1024, 4096, 16384]
+        self.tune_torch_threads = [1, 2, 4]
+        self.tune_loader_workers = [0, 2, 4, 8]
+        self.tune_loader_batch_sizes = [600, 2400] # batch_size_test candidates
+        self.tune_loader_batches = 20 # test set batches read per loader setting
+        self.tune_length = 20000 # samples per row of the timed decodes
+        self.tune_batch = 8 # rows decoded together by the timed decodes
+        self.tune_repeats = 3 # timed decodes per setting, the fastest one is kept
+        self.tuned_profile_file = None # json written by ai_sys/Auto_Tune.py, the settings tuned for model_arch replace the ones here
         
         # rf channel params
         self.tap_bd_num = 6
         self.jitteron = False
         self.addsineon = True
         self.signal_norm = True
+        # (jitteron, disturbance) pairs evaluated in one PRML run, disturbance is None, 'addsin' or 'multiplysin'
+        # e.g. [(True, 'addsin'), (True, None), (False, 'addsin'), (False, None), (False, 'multiplysin')]
+        # None evaluates only the jitteron/addsineon channel
+        self.impairments = None
         
         # target channel params
         self.PR_coefs = [1, 2, 2, 2, 1]
@@ -51,6 +123,15 @@ class Params:
         self.train_set_batches = 200
         self.test_set_batches = 100
         self.validate_set_batches = 100
+        self.shard_batches = 5 # generation batches per dataset shard
+        self.dataset_workers = None # processes building shards, None uses every core
+        self.dataset_seed = 12345
+        self.dataset_signal_dtype = 'float16' # 'float16' or 'float32'
+        self.dataset_pack_labels = True
+        self.dataset_clean_signal = True # store noiseless train/test records, awgn is added per batch
+        self.train_on_the_fly = False # simulate nn training data in the DataLoader workers
+        self.synthetic_records = 8 # records shuffled together by SyntheticDataset
+        self.synthetic_steps_per_epoch = 1000
         self.data_train_len = 5000
         self.data_test_len = 5000
         self.data_val_len = 5000
@@ -62,16 +143,21 @@ class Params:
         self.batch_size_train = 600
         self.batch_size_test = 600
         self.batch_size_val = 600
+        self.decode_batch_size = 4096 # blocks per forward pass when decoding a whole record
+        self.loader_workers = 4 # DataLoader worker processes of the training script
+        self.torch_threads = None # torch intra-op threads of the nn models, None keeps the torch default
 
         # general model arch params
         self.input_size = 6 # dimension of a feature should always equal to length of channel memory length
         self.output_size = 1 # model determine whether the current bit is 0 or 1
+        self.raw_input = False # nn models take the raw (batch, block_length) samples and build their windows with a causal conv, the checkpoints are the same
         # self.model_arch = "lr"
         # self.model_arch = "xgboost"
         # self.model_arch = "mlp"
         # self.model_arch = "cnn"
         # self.model_arch = "unet"
         self.model_arch = "rnn"
+        # self.model_arch = "rnn_stream"
         # self.model_arch = "transformer"
         
         # mlp model arch params
@@ -96,6 +182,8 @@ class Params:
         self.rnn_hidden_size = 8
         self.rnn_layer = 1
         self.rnn_dropout_ratio = 0.0
+        self.rnn_lookahead = 12 # samples the backward GRU of rnn_stream sees after every eval_length samples, 0 for none
+        self.rnn_lane_length = 600 # samples per parallel lane when rnn_stream decodes a whole record
         
         # transformer model arch params
         self.transformer_d_model = 6
@@ -110,6 +198,11 @@ class Params:
         self.eval_start = 0
         self.print_freq_ep = 5
         
+        # distillation params, model_arch is the student
+        self.distill_teacher = None # trained nn model_arch whose outputs the student learns, None trains on the labels only
+        self.distill_alpha = 0.7 # weight of the teacher loss, the label loss has 1 - distill_alpha
+        self.distill_temperature = 2.0 # teacher and student logits are divided by it before the teacher loss
+        
         # optimizer params
         self.learning_rate = 0.001 
         self.momentum = 0.9
@@ -118,4 +211,27 @@ class Params:
         # model infer params
         self.eval_length = 60
         self.overlap_length = 60
+        self.use_frozen_model = False # nn models decode with the model ai_sys/Model_Export.py exported, when there is one
+        self.use_numpy_model = False # mlp, cnn and lr decode without torch with the weights ai_sys/Numpy_Runtime.py exported, when there are some
+        
+        # model export params
+        self.export_quantize = True # dynamic int8 quantization of the Linear and GRU layers
+        self.export_snrs = [8, 10] # snrs the exported model is checked against the float model at
+        self.export_info_len = 100000 # info bits per snr of the check
+        self.export_ber_tolerance = 0.001 # ber increase over the float model the exported model may have
+        self.numpy_prob_tolerance = 1e-4 # probability difference to the loaded model the numpy model may have
+        
+        if self.tuned_profile_file:
+            self.apply_tuned_profile(self.tuned_profile_file)
+
+    def apply_tuned_profile(self, profile_file, detector=None):
+        """
+        @brief replace the settings with those tuned for detector, model_arch by default
+        """
+        detector = detector or self.model_arch
+        with open(profile_file) as file:
+            profile = json.load(file)
+        if detector in profile:
+            for name, value in profile[detector]['settings'].items():
+                setattr(self, name, value)
     
@@ -0,0 +1,148 @@
+import sys
+import os
+import csv
+import json
+import time
+import resource
+import threading
+import contextlib
+import tracemalloc
+if __name__ == '__main__':
+    # run as a script, make the lib package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.Params import Params
+
+## Stage_Profiler: opt-in wall/cpu timers, call counts and allocations per named stage
+class Stage_Profiler(object):
+    '''
+    with profiler.stage("viterbi"): ... or fn = profiler.wrap("viterbi", fn)
+    accumulate the stage until profiler.point(snr=...) closes the point and
+    turns the counters into one record per stage; save() writes them as json or csv.
+    Disabled (params.profile False) a stage is one shared no-op context and
+    wrap() returns the function itself.
+    cpu time is the process time, it includes the threads a stage starts;
+    stages running in a worker process are not seen by this profiler.
+    '''
+    def __init__(self, params:Params):
+        self.params = params
+        self.enabled = params.profile
+        self.records = []
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.disabled_stage = contextlib.nullcontext()
+        if self.enabled and params.profile_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name):
+        if not self.enabled:
+            return self.disabled_stage
+        return self.timed_stage(name)
+
+    def wrap(self, name, fn):
+        if not self.enabled:
+            return fn
+        def timed(*args, **kwargs):
+            with self.timed_stage(name):
+                return fn(*args, **kwargs)
+        return timed
+
+    @contextlib.contextmanager
+    def timed_stage(self, name):
+        # the enclosing stages of this thread, their allocation peak survives
+        # the reset_peak of a nested stage
+        stack = self.local.__dict__.setdefault('stack', [])
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            entry = {'start': current, 'peak': current}
+        else:
+            entry = {}
+        stack.append(entry)
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            stack.pop()
+            alloc = 0
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1], entry['peak'])
+                alloc = peak - entry['start']
+                if stack:
+                    stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+
+            with self.lock:
+                counter = self.counters.setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'alloc_peak_bytes': 0})
+                counter['calls'] += 1
+                counter['wall_s'] += wall
+                counter['cpu_s'] += cpu
+                counter['alloc_peak_bytes'] = max(counter['alloc_peak_bytes'], alloc)
+
+    def point(self, **labels):
+        '''
+        closes the current point, e.g. one snr, labels are written with every record of it
+        '''
+        if not self.enabled:
+            return
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        with self.lock:
+            counters, self.counters = self.counters, {}
+        for name, counter in counters.items():
+            self.records.append({**labels, 'stage': name, **counter, 'peak_rss_mb': peak_rss_mb})
+
+    def save(self, log_file=None):
+        '''
+        writes the records to log_file (params.profile_log_file by default), csv for a .csv file, json else
+        '''
+        if not self.enabled:
+            return
+        log_file = log_file or self.params.profile_log_file
+        with open(log_file, "w", newline='') as file:
+            if os.path.splitext(log_file)[1] == ".csv":
+                fieldnames = list(dict.fromkeys(key for record in self.records for key in record))
+                writer = csv.DictWriter(file, fieldnames)
+                writer.writeheader()
+                writer.writerows(self.records)
+            else:
+                # labels may be numpy scalars, e.g. the snr of a sweep
+                json.dump(self.records, file, indent=1, default=lambda value: value.item())
+        print(f"profile data have save to {log_file}")
+
+def profile_run(params:Params, fn, *args, **kwargs):
+    '''
+    runs fn(*args, **kwargs) under cProfile or tracemalloc as params.profile_run
+    selects, printing the params.profile_top functions or allocation sites
+    '''
+    if params.profile_run == "cprofile":
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(fn, *args, **kwargs)
+        finally:
+            profiler.dump_stats(params.profile_stats_file)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(params.profile_top)
+            print(f"profile stats have save to {params.profile_stats_file}")
+    elif params.profile_run == "tracemalloc":
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if started:
+                tracemalloc.stop()
+            print(f"traced memory: current {current / 2**20:.2f} MB, peak {peak / 2**20:.2f} MB")
+            for stat in snapshot.statistics("lineno")[:params.profile_top]:
+                print(stat)
+    elif params.profile_run is None:
+        return fn(*args, **kwargs)
+    else:
+        raise ValueError(f"unknown profile_run {params.profile_run}, use None, 'cprofile' or 'tracemalloc'")
@@ -0,0 +1,401 @@
+import sys
+import os
+import collections
+import threading
+import queue
+import multiprocessing
+import numpy as np
+if __name__ == '__main__':
+    # run as a script, make the lib package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.Params import Params
+
+## Stream_Stage: one stage of a chunked pipeline with carry-over state
+class Stream_Stage(object):
+    '''
+    process() maps one (1, length) chunk to the next chunk, keeping whatever
+    the following chunk needs (filter tails, coder states) in the stage;
+    flush() returns what is still held back once the input has ended
+    '''
+    process_safe = True # state only the stage itself reads, it may run in a worker process
+    
+    def process(self, x):
+        raise NotImplementedError
+
+    def flush(self):
+        return None
+
+    def stream(self, chunks):
+        for x in chunks:
+            y = self.process(x)
+            if y is not None and y.shape[1]:
+                yield y
+        y = self.flush()
+        if y is not None and y.shape[1]:
+            yield y
+
+def chain(source, *stages):
+    '''
+    Input: iterable of (1, length) chunks, stages
+    Output: generator of the chunks leaving the last stage
+    Mapping: stages are pulled one chunk at a time, so at most one chunk per stage is in flight
+    '''
+    for stage in stages:
+        source = stage.stream(source)
+    return source
+
+## Stream_End, Stream_Error: queue items closing a stream
+class Stream_End(object):
+    pass
+
+class Stream_Error(object):
+    def __init__(self, error):
+        self.error = error
+
+def queue_items(in_queue, stop=None, check=None):
+    '''
+    output: generator of the items of in_queue up to its Stream_End, it returns
+    once stop is set and calls check while in_queue stays empty
+    '''
+    while True:
+        try:
+            item = in_queue.get(timeout=0.1)
+        except queue.Empty:
+            if stop is not None and stop.is_set():
+                return
+            if check is not None:
+                check()
+            continue
+        if isinstance(item, Stream_End):
+            return
+        if isinstance(item, Stream_Error):
+            raise item.error
+        yield item
+
+def queue_put(out_queue, item, stop):
+    '''
+    output: True once item is in out_queue, False if the stream was stopped before
+    '''
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def run_worker(stage, in_queue, out_queue, stop):
+    '''
+    feeds the chunks of in_queue through the stage into out_queue; the stage
+    None forwards the chunks of the source iterable in_queue; returns early
+    once stop is set
+    '''
+    try:
+        items = in_queue if stage is None else stage.stream(queue_items(in_queue, stop))
+        for y in items:
+            if not queue_put(out_queue, y, stop):
+                return
+        queue_put(out_queue, Stream_End(), stop)
+    except Exception as error:
+        queue_put(out_queue, Stream_Error(error), stop)
+
+def process_context():
+    '''
+    fork start method for the process workers: the stages may hold closures
+    (detector state, profiler wrappers) that do not pickle under spawn;
+    None where fork is not available, the process workers become threads
+    '''
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+def concurrent_chain(source, stages, workers='thread', queue_size=4):
+    '''
+    Input: iterable of (1, length) chunks, stages, 'thread' or 'process' for
+    all stages or one of them per stage, chunks a queue holds at most
+    Output: generator of the chunks leaving the last stage
+    Mapping: chain() with every stage in its own worker, stages are connected
+    by bounded queues so stage i works on chunk n+1 while stage i+1 works on
+    chunk n; stages that are not process_safe always run in a thread. Once the
+    generator ends or is closed early, the workers are stopped and joined; a
+    process worker exiting abnormally raises RuntimeError
+    '''
+    if isinstance(workers, str):
+        workers = [workers]*len(stages)
+    context = process_context()
+    workers = ['thread' if context is None or not stage.process_safe else worker
+               for stage, worker in zip(stages, workers)]
+    stop = context.Event() if context is not None else threading.Event()
+    
+    # the source is drained by a thread of its own
+    kinds = ['thread'] + workers
+    in_queue = source
+    running = []
+    try:
+        for i, stage in enumerate([None] + list(stages)):
+            next_kind = kinds[i+1] if i + 1 < len(kinds) else 'thread'
+            if 'process' in (kinds[i], next_kind):
+                out_queue = context.Queue(queue_size)
+            else:
+                out_queue = queue.Queue(queue_size)
+            
+            if kinds[i] == 'process':
+                worker = context.Process(target=run_worker, args=(stage, in_queue, out_queue, stop), daemon=True)
+            else:
+                worker = threading.Thread(target=run_worker, args=(stage, in_queue, out_queue, stop), daemon=True)
+            worker.start()
+            running.append(worker)
+            in_queue = out_queue
+        
+        def check_workers():
+            # a killed process, e.g. by the oom killer, never closes its queue
+            for worker in running:
+                if isinstance(worker, multiprocessing.process.BaseProcess) and worker.exitcode not in (None, 0):
+                    raise RuntimeError(f"streaming worker {worker.name} exited with code {worker.exitcode}")
+        
+        yield from queue_items(in_queue, check=check_workers)
+    finally:
+        stop.set()
+        for worker in running:
+            worker.join(timeout=1)
+            if isinstance(worker, multiprocessing.process.BaseProcess) and worker.is_alive():
+                worker.terminate()
+                worker.join()
+
+def info_source(info_len, chunk_bits, prob=0.5, rng=np.random):
+    '''
+    Input: number of info bits, info bits per chunk, probability of a 1, random state
+    Output: generator of (1, chunk_bits) info chunks
+    '''
+    chunk_bits += chunk_bits % 2 # the RLL encoder consumes pairs of bits
+    for pos in range(0, info_len, chunk_bits):
+        size = min(chunk_bits, info_len - pos)
+        yield rng.choice(np.arange(0, 2), size = (1, size), p=[1-prob, prob])
+
+## Tee: pass chunks through and keep a copy for a later consumer, e.g. the reference codeword
+class Tee(Stream_Stage):
+    process_safe = False
+    
+    def __init__(self):
+        self.buffer = collections.deque()
+
+    def process(self, x):
+        self.buffer.append(x)
+        return x
+
+    def pop(self, length):
+        '''
+        output: (1, length) oldest samples kept, fewer if the stream has ended
+        '''
+        chunks, size = [], 0
+        while size < length and self.buffer:
+            x = self.buffer.popleft()
+            if size + x.shape[1] > length:
+                self.buffer.appendleft(x[:, length - size:])
+                x = x[:, :length - size]
+            chunks.append(x)
+            size += x.shape[1]
+        return np.concatenate(chunks, axis=1) if chunks else np.zeros((1, 0))
+
+class RLL_Stage(Stream_Stage):
+    '''
+    constrained RLL(1,7) encoder continuing from the state the last chunk ended in
+    '''
+    def __init__(self, RLL_modulator):
+        self.RLL_modulator = RLL_modulator
+        self.state = RLL_modulator.ini_state
+
+    def process(self, x):
+        ini_state = self.RLL_modulator.ini_state
+        self.RLL_modulator.ini_state = self.state
+        codeword = self.RLL_modulator.forward_coding(x)
+        self.RLL_modulator.ini_state = ini_state
+        self.state = self.RLL_modulator.end_state
+        return codeword
+
+class NRZI_Stage(Stream_Stage):
+    '''
+    x = (1 / 1 + D) z (mod 2), continuing from the last output of the previous chunk
+    '''
+    def __init__(self):
+        self.parity = 0
+
+    def process(self, z):
+        x = (self.parity + np.cumsum(z, axis=1)) % 2
+        self.parity = x[0, -1]
+        return x.astype(np.float64)
+
+class RF_Channel_Stage(Stream_Stage):
+    '''
+    Disk_Read_Channel.RF_signal_jitter on a stream: the rf signal of the ideal
+    codeword or, with jitteron (params.jitteron by default), of the jittered upsampled codeword.
+    The jitter of a transition also shortens the previous bit, so the last
+    bit of every chunk is held back until the next chunk is known; the
+    convolution tail and the downsampling phase are carried as well.
+    '''
+    def __init__(self, params:Params, disk_read_channel, jitteron=None, rng=np.random):
+        self.params = params
+        self.rng = rng
+        self.jitteron = params.jitteron if jitteron is None else jitteron
+        upsample_factor = params.upsample_factor
+        self.coef = disk_read_channel.bd_di_coef[0, :]
+        self.coef_down = self.coef[::upsample_factor]
+
+        self.coef_sum = sum(self.coef_down)
+        self.coef_upsample_sum = sum(self.coef)
+        if not params.signal_norm:
+            self.coef_upsample_sum /= self.coef_sum
+            self.coef_sum = 1
+
+        max_jcl, min_jcl = upsample_factor*params.jcl_stop, upsample_factor*params.jcl_start
+        self.miu = (max_jcl + min_jcl)/2
+        self.sigma = (max_jcl - self.miu)/3
+
+        self.tail = np.zeros(len(self.coef_down) - 1)
+        self.tail_upsample = np.zeros(len(self.coef) - 1)
+        self.pending = None # (bit, jitter) of the held back bit
+        self.upsample_pos = 0
+
+    def draw_jitter(self, num):
+        random_jitter = self.rng.normal(self.miu, self.sigma, num)*self.rng.choice([-1, 1], num)
+        return np.round(random_jitter).astype(int)
+
+    def filter(self, coef, tail, x):
+        # causal FIR continuing from the tail of the previous input
+        x = np.concatenate([tail, x])
+        return np.convolve(coef, x)[len(tail):len(x)], x[len(x) - len(tail):]
+
+    def upsample_filter(self, bits, jitter):
+        upsample_factor = self.params.upsample_factor
+        signal_upsample_jittered = np.repeat(bits, upsample_factor + jitter)
+        y, self.tail_upsample = self.filter(self.coef, self.tail_upsample, signal_upsample_jittered)
+        # keep the samples at multiples of upsample_factor of the whole stream
+        y = y[(-self.upsample_pos) % upsample_factor::upsample_factor]
+        self.upsample_pos += len(signal_upsample_jittered)
+        return y.reshape(1, -1) / self.coef_upsample_sum
+
+    def process(self, codeword):
+        if not self.jitteron:
+            y, self.tail = self.filter(self.coef_down, self.tail, codeword[0, :])
+            return y.reshape(1, -1) / self.coef_sum
+
+        bits = codeword[0, :]
+        jitter = np.zeros(len(bits) + 1, dtype=int)
+        if self.pending is not None:
+            bits = np.concatenate([[self.pending[0]], bits])
+            jitter[0] = self.pending[1]
+        else:
+            jitter = jitter[1:]
+
+        # the first bit of the stream is not considered
+        transition = np.nonzero(np.diff(bits))[0] + 1
+        random_jitter = self.draw_jitter(len(transition))
+        jitter[transition] = random_jitter
+        jitter[transition - 1] = -random_jitter
+
+        self.pending = (bits[-1], jitter[-1])
+        return self.upsample_filter(bits[:-1], jitter[:-1])
+
+    def flush(self):
+        if not self.jitteron or self.pending is None:
+            return None
+        bits, jitter = np.array([self.pending[0]]), np.array([self.pending[1]])
+        self.pending = None
+        return self.upsample_filter(bits, jitter)
+
+class AWGN_Stage(Stream_Stage):
+    '''
+    Disk_Read_Channel.awgn on a stream, the energy is measured on the first
+    params.truncation4energy samples of the first chunk
+    '''
+    def __init__(self, params:Params, snr, rng=np.random):
+        self.params = params
+        self.snr = snr
+        self.rng = rng
+        self.sigma = None
+
+    def process(self, x):
+        if self.sigma is None:
+            E_b = np.mean(np.square(x[0, :self.params.truncation4energy]))
+            self.sigma = np.sqrt(0.5 * E_b * 10 ** (- self.snr * 1.0 / 10))
+        return x + self.sigma * self.rng.normal(0, 1, x.shape)
+
+class Sine_Stage(Stream_Stage):
+    '''
+    Disk_Read_Channel.addsin or multiplysin continuing the sine phase across chunks
+    '''
+    def __init__(self, disk_read_channel, disturbance):
+        self.disk_read_channel = disk_read_channel
+        self.disturbance = disturbance
+        self.t0 = 0
+
+    def process(self, x):
+        if self.disturbance == 'addsin':
+            y = self.disk_read_channel.addsin(x, self.t0)
+        elif self.disturbance == 'multiplysin':
+            y = self.disk_read_channel.multiplysin(x, self.t0)
+        else:
+            y = x
+        self.t0 += x.shape[1]
+        return y
+
+class FIR_Stage(Stream_Stage):
+    '''
+    Adaptive_Equalizer.equalized_signal on a stream, with the last
+    taps_num - 1 inputs kept as delay line
+    '''
+    def __init__(self, equalizer_coeffs):
+        self.equalizer_coeffs = equalizer_coeffs.reshape(-1)
+        self.delay_line = np.zeros(len(self.equalizer_coeffs) - 1)
+
+    def process(self, x):
+        x = np.concatenate([self.delay_line, x[0, :]])
+        y = np.convolve(self.equalizer_coeffs, x)[len(self.delay_line):len(x)]
+        self.delay_line = x[len(x) - len(self.delay_line):]
+        return y.reshape(1, -1)
+
+class Block_Detector_Stage(Stream_Stage):
+    '''
+    cuts the stream into blocks of eval_length + overlap_length starting every
+    eval_length samples and keeps the eval_length decisions of each block;
+    decode_blocks maps (num_block, block_length) blocks to (num_block, eval_length)
+    decisions and may keep its own state across calls, e.g. Viterbi metrics
+    '''
+    def __init__(self, params:Params, decode_blocks):
+        self.params = params
+        self.decode_blocks = decode_blocks
+        self.buffer = np.zeros(0)
+
+    def process(self, x):
+        params = self.params
+        block_length = params.eval_length + params.overlap_length
+        self.buffer = np.concatenate([self.buffer, x[0, :]])
+        if len(self.buffer) < block_length:
+            return None
+
+        num_block = (len(self.buffer) - block_length) // params.eval_length + 1
+        blocks = np.lib.stride_tricks.sliding_window_view(self.buffer, block_length)[::params.eval_length][:num_block]
+        dec = self.decode_blocks(blocks)
+        self.buffer = self.buffer[num_block*params.eval_length:]
+        return np.asarray(dec).reshape(1, -1)
+
+class BER_Counter(object):
+    '''
+    counts the bit errors of a decision stream against the reference kept by a Tee,
+    over the first num_bits bits
+    '''
+    def __init__(self, reference:Tee, num_bits):
+        self.reference = reference
+        self.num_bits = num_bits
+        self.num_errors = 0
+        self.num_compared = 0
+
+    def consume(self, decisions):
+        for dec in decisions:
+            ref = self.reference.pop(dec.shape[1])
+            size = min(ref.shape[1], self.num_bits - self.num_compared)
+            if size <= 0:
+                continue
+            self.num_errors += np.count_nonzero(ref[0, :size] != dec[0, :size])
+            self.num_compared += size
+        return self.num_errors / max(self.num_compared, 1)
@@ -1,18 +1,15 @@
 import sys
 import os
 import numpy as np
-sys.path.append(
-    os.path.dirname(
-        os.path.abspath(__file__)))
-from Const import RLL_state_machine
-from Channel_Modulator import RLL_Modulator
-from Channel_Converter import NRZI_Converter
-from Target_PR_Response import partial_response
-from Utils import plot_separated, plot_eye_diagram
-from Params import Params
-sys.path.pop()
+if __name__ == '__main__':
+    # run as a script, make the lib package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.Const import RLL_state_machine
+from lib.Channel_Modulator import RLL_Modulator
+from lib.Channel_Converter import NRZI_Converter
+from lib.Target_PR_Response import partial_response
+from lib.Params import Params
 
-np.random.seed(12345)
     
 class Target_PR_Channel(object):
     
@@ -24,12 +21,13 @@ class Target_PR_Channel(object):
         mid_idx = len(PR_coefs)//2
         self.PR_coefs = PR_coefs[mid_idx : mid_idx + upsample_factor*len(params.PR_coefs)].reshape(1,-1)
         
-        print('\nTarget Channel coefficient is')
-        print(PR_coefs)
-        print(f"PR_coefs.shape: {PR_coefs.shape}")
-        print('\nTap target Channel coefficient is')
-        print(self.PR_coefs)
-        print(f"self.PR_coefs.shape: {self.PR_coefs.shape}")
+        if params.verbose:
+            print('\nTarget Channel coefficient is')
+            print(PR_coefs)
+            print(f"PR_coefs.shape: {PR_coefs.shape}")
+            print('\nTap target Channel coefficient is')
+            print(self.PR_coefs)
+            print(f"self.PR_coefs.shape: {self.PR_coefs.shape}")
     
     def target_channel_jitter(self, codeword):
         params = self.params
@@ -79,9 +77,12 @@ class Target_PR_Channel(object):
         return x_noise  
     
 if __name__ == '__main__':
+    from lib.Plot_Utils import plot_separated, plot_eye_diagram
+    np.random.seed(12345)
     
     # constant and input paras
     params = Params()
+    params.verbose = True
     encoder_dict, encoder_definite = RLL_state_machine()
 
     # rate for constrained code
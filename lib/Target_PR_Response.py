@@ -1,12 +1,11 @@
 import sys
 import os
 import numpy as np
-sys.path.append(
-    os.path.dirname(
-        os.path.abspath(__file__)))
-from Disk_Response import BD_symbol_response, HDDVD_symbol_response
-from Utils import plot_altogether, plot_separated, Fourier_Analysis
-sys.path.pop()
+if __name__ == '__main__':
+    # run as a script, make the lib package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.Disk_Response import BD_symbol_response, HDDVD_symbol_response
+from lib.Utils import Fourier_Analysis
 
 def sinc(x):
     return np.sinc(x / np.pi)
@@ -21,6 +20,7 @@ def partial_response(PR_coefs, bit_periods, T_L = 74.5e-9, upsample_factor = 1):
     return t/T_L, target_pr
 
 if __name__ == '__main__':
+    from lib.Plot_Utils import plot_altogether, plot_separated
     
     bit_periods = 10
     BD_T_L = 74.5e-9
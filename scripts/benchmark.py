@@ -0,0 +1,237 @@
+import sys
+import os
+import json
+import time
+import queue
+import resource
+import tracemalloc
+import multiprocessing
+import numpy as np
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__))))
+from lib.Params import Params
+from lib.Const import RLL_state_machine
+from lib.Channel_Modulator import RLL_Modulator
+from lib.Channel_Converter import NRZI_Converter
+from lib.Disk_Read_Channel import Disk_Read_Channel
+from lib.Utils import sliding_shape
+from classical.Viterbi import prml_detector
+sys.path.pop()
+
+## benchmark cases: setup(params, length, batch) -> run, units processed by one run, unit name
+def random_codeword(length, batch=1):
+    x = np.cumsum(np.random.randint(2, size=(batch, length)), axis=1) % 2
+    return x.astype(np.float64)
+
+def equalizer(params:Params, taps_num=15):
+    _, pr_adaptive_equalizer = prml_detector(params, np.random.randn(1, taps_num) / taps_num)
+    return pr_adaptive_equalizer
+
+def bench_rll(params:Params, length, batch):
+    encoder_dict, encoder_definite = RLL_state_machine()
+    RLL_modulator = RLL_Modulator(encoder_dict, encoder_definite)
+    info = np.random.randint(2, size=(1, length - length % 2))
+    return lambda: RLL_modulator.forward_coding(info), info.shape[1], 'bits'
+
+def bench_nrzi(params:Params, length, batch):
+    NRZI_converter = NRZI_Converter()
+    z = np.random.randint(2, size=(1, length))
+    return lambda: NRZI_converter.forward_coding(z), length, 'bits'
+
+def bench_rf_signal_jitter(params:Params, length, batch):
+    disk_read_channel = Disk_Read_Channel(params)
+    codeword = random_codeword(length)
+    return lambda: disk_read_channel.RF_signal_jitter(codeword), length, 'samples'
+
+def bench_awgn(params:Params, length, batch):
+    disk_read_channel = Disk_Read_Channel(params)
+    x = random_codeword(length)
+    snrs = params.snr_start + np.arange(batch)
+    return lambda: disk_read_channel.awgn_sweep(x, snrs), length*batch, 'samples'
+
+def bench_lms(params:Params, length, batch):
+    pr_adaptive_equalizer = equalizer(params)
+    pr_adaptive_equalizer.equalizer_input = np.random.randn(1, length)
+    pr_adaptive_equalizer.reference_signal = np.random.randn(1, length)
+    return pr_adaptive_equalizer.lms, length, 'samples'
+
+def bench_equalized_signal(params:Params, length, batch):
+    pr_adaptive_equalizer = equalizer(params)
+    pr_adaptive_equalizer.equalizer_input = np.random.randn(batch, length)
+    return pr_adaptive_equalizer.equalized_signal, length*batch, 'samples'
+
+def bench_viterbi(params:Params, length, batch):
+    # the equalizer is not timed, its coefficients do not matter
+    viterbi_detector, _ = prml_detector(params, np.zeros((1, 15)))
+    r = np.random.randn(batch, length)
+    return lambda: viterbi_detector.vit_dec_record(r), length*batch, 'samples'
+
+def bench_sliding_shape(params:Params, length, batch):
+    x = np.random.randn(batch, length)
+    return lambda: sliding_shape(x, params.input_size, contiguous=True), length*batch, 'samples'
+
+def bench_decode(model_arch):
+    def setup(params:Params, length, batch):
+        # the registry imports the model modules of ai_sys on first use,
+        # the case runs in a child process of its own so the path is not restored
+        sys.path.append(
+            os.path.join(
+                os.path.dirname(
+                    os.path.dirname(
+                        os.path.abspath(__file__))), 'ai_sys'))
+        from Model_Registry import get_spec, load_model, default_device
+
+        params.model_arch = model_arch
+        spec = get_spec(model_arch)
+        if not spec.is_nn and not os.path.isfile(spec.model_path(params)):
+            raise FileNotFoundError(f"no model found at '{spec.model_path(params)}'")
+        device = default_device() if spec.is_nn else None
+        model, _ = load_model(params, device)
+
+        x = np.random.randn(batch, length)
+        if spec.decode == 'record':
+            return lambda: model.decode_record(x, device), length*batch, 'samples'
+        features = sliding_shape(x, params.input_size).reshape(-1, params.input_size)
+        return lambda: model.decode(features.shape[0], features), length*batch, 'samples'
+    return setup
+
+bench_cases = {
+    'rll': (bench_rll, False),
+    'nrzi': (bench_nrzi, False),
+    'rf_signal_jitter': (bench_rf_signal_jitter, False),
+    'awgn': (bench_awgn, True),
+    'lms': (bench_lms, False),
+    'equalized_signal': (bench_equalized_signal, True),
+    'viterbi': (bench_viterbi, True),
+    'sliding_shape': (bench_sliding_shape, True),
+}
+for model_arch in ["lr", "xgboost", "mlp", "cnn", "unet", "rnn", "rnn_stream", "transformer"]:
+    bench_cases[f"decode_{model_arch}"] = (bench_decode(model_arch), True)
+
+def current_rss():
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * resource.getpagesize()
+
+def run_case(params:Params, case, length, batch, result_queue):
+    '''
+    runs in a child process of its own, so that the peak rss belongs to this case only
+    '''
+    try:
+        np.random.seed(12345)
+        rss_start = current_rss()
+        setup, _ = bench_cases[case]
+        run, num_units, unit = setup(params, length, batch)
+
+        run() # warm-up
+        seconds = []
+        for _ in range(params.benchmark_repeats):
+            start = time.perf_counter()
+            run()
+            seconds.append(time.perf_counter() - start)
+
+        # traced apart from the timed runs, tracemalloc slows down allocations
+        tracemalloc.start()
+        run()
+        _, peak_alloc = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        result_queue.put({
+            'case': case,
+            'length': length,
+            'batch': batch,
+            'seconds': min(seconds),
+            'throughput': num_units / min(seconds),
+            'unit': f"{unit}/s",
+            'peak_alloc_mb': peak_alloc / 2**20,
+            'peak_rss_mb': max(peak_rss - rss_start, 0) / 2**20
+        })
+    except Exception as error:
+        result_queue.put({'case': case, 'length': length, 'batch': batch, 'skipped': str(error)})
+
+def wait_case(params:Params, worker, result_queue):
+    '''
+    output: the result of the case worker runs, a failed result when it dies
+    without one or runs longer than params.benchmark_timeout
+    '''
+    deadline = time.monotonic() + params.benchmark_timeout
+    while True:
+        try:
+            return result_queue.get(timeout=1)
+        except queue.Empty:
+            pass
+        if not worker.is_alive():
+            # a result put just before the exit may still be in the pipe
+            try:
+                return result_queue.get(timeout=1)
+            except queue.Empty:
+                return {'failed': f"worker exited with code {worker.exitcode}"}
+        if time.monotonic() > deadline:
+            worker.terminate()
+            return {'failed': f"timed out after {params.benchmark_timeout} s"}
+
+def benchmark(params:Params):
+    context = multiprocessing.get_context('fork')
+    result_queue = context.Queue()
+    results = []
+    for case in params.benchmark_cases or bench_cases:
+        _, batched = bench_cases[case]
+        for length in params.benchmark_lengths:
+            for batch in (params.benchmark_batches if batched else [1]):
+                worker = context.Process(target=run_case, args=(params, case, length, batch, result_queue))
+                worker.start()
+                result = wait_case(params, worker, result_queue)
+                worker.join()
+                if 'failed' in result:
+                    result = {'case': case, 'length': length, 'batch': batch, **result}
+                results.append(result)
+
+                if 'failed' in result:
+                    print(f"{case:>22} length {length:>8} batch {batch:>3}: failed, {result['failed']}")
+                elif 'skipped' in result:
+                    print(f"{case:>22} length {length:>8} batch {batch:>3}: skipped, {result['skipped']}")
+                else:
+                    print(f"{case:>22} length {length:>8} batch {batch:>3}: "
+                          f"{result['throughput']:12.4g} {result['unit']}, "
+                          f"peak alloc {result['peak_alloc_mb']:8.2f} MB, peak rss {result['peak_rss_mb']:8.2f} MB")
+    return results
+
+def compare_baseline(results, baseline, tolerance):
+    '''
+    output: results whose throughput dropped by more than tolerance against the baseline
+    '''
+    baseline = {(result['case'], result['length'], result['batch']): result
+                for result in baseline if 'throughput' in result}
+    regressions = []
+    for result in results:
+        reference = baseline.get((result['case'], result['length'], result['batch']))
+        if 'throughput' not in result or reference is None:
+            continue
+        result['baseline_ratio'] = result['throughput'] / reference['throughput']
+        if result['baseline_ratio'] < 1 - tolerance:
+            regressions.append(result)
+    return regressions
+
+if __name__ == '__main__':
+    params = Params()
+    results = benchmark(params)
+
+    if os.path.isfile(params.benchmark_baseline_file):
+        with open(params.benchmark_baseline_file) as file:
+            regressions = compare_baseline(results, json.load(file), params.benchmark_tolerance)
+    else:
+        with open(params.benchmark_baseline_file, "w") as file:
+            json.dump(results, file, indent=1)
+        print(f"benchmark baseline have save to {params.benchmark_baseline_file}")
+        regressions = []
+
+    with open(params.benchmark_result_file, "w") as file:
+        json.dump(results, file, indent=1)
+    print(f"benchmark data have save to {params.benchmark_result_file}")
+
+    for result in regressions:
+        print(f"regression: {result['case']} length {result['length']} batch {result['batch']} "
+              f"at {result['baseline_ratio']:.2f} of the baseline throughput")
+    sys.exit(1 if regressions else 0)
@@ -6,7 +6,7 @@ sys.path.append(
         os.path.dirname(
             os.path.abspath(__file__))))
 from lib.Params import Params
-from lib.Utils import plot_altogether
+from lib.Plot_Utils import plot_altogether
 sys.path.pop()   
 
 def find_result_files(path):